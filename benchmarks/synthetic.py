@@ -0,0 +1,158 @@
+"""
+Generates a synthetic Getic catalogue for benchmarks: API payloads shaped like
+the preset-subcategory responses, and the price and stock of N products over
+M daily runs. The catalogue is deterministic for a given seed, so benchmark
+runs on different commits see the same data.
+"""
+import json
+import random
+from decimal import Decimal
+from index_benchmark import CATEGORIES
+
+WORDS = [
+    "Wireless",
+    "Outdoor",
+    "Router",
+    "Switch",
+    "Camera",
+    "Antenna",
+    "Cable",
+    "Mount",
+    "Sensor",
+    "Tracker",
+    "Gateway",
+    "Access",
+    "Point",
+    "Fiber",
+    "Module",
+    "Bracket",
+    "Cabinet",
+    "Adapter",
+    "Pro",
+    "Lite",
+    "Mini",
+    "Max",
+    "LTE",
+    "PoE",
+    "Dual",
+    "Band",
+]
+STOCK_CONDITION_ID = "000000001"  # Condition read by ingestion
+PRICE_CHANGES = [Decimal("0.9"), Decimal("0.95"), Decimal("1.05"), Decimal("1.1")]
+
+
+class SyntheticCatalogue:
+    """
+    Products whose price and stock evolve from run to run: daily sales drain
+    the stock, periodic restocks refill it and prices occasionally change.
+    """
+
+    def __init__(self, products=5000, seed=42, subcategories=8, brands=300):
+        self.seed = seed
+        rng = random.Random(seed)
+        self.products = []
+        for index in range(products):
+            category = CATEGORIES[index % len(CATEGORIES)]
+            subcategory = rng.randrange(subcategories)
+            subcategory_title = f"{category.replace('-', ' ').title()} {subcategory}"
+            product_id = 100000 + index
+            self.products.append(
+                {
+                    "product_id": product_id,
+                    "product_name": f"{' '.join(rng.sample(WORDS, 4))} {index}",
+                    "brand": f"Brand {rng.randrange(brands)}",
+                    "category": category,
+                    "subcategory": subcategory_title,
+                    "subcategory_id": CATEGORIES.index(category) * 100 + subcategory,
+                    "price": Decimal(rng.randrange(500, 200000)) / 100,
+                    "stock": rng.randrange(0, 200),
+                    "daily_sales": rng.choice([0, 0, 1, 1, 2, 3, 5, 10]),
+                    "restock_every": rng.choice([7, 14, 30]),
+                    "image": f"/media/products/{product_id}/large.jpg",
+                }
+            )
+
+    def simulate(self, runs):
+        """
+        Steps the catalogue through daily runs.
+
+            Parameters:
+                    runs (int): Number of runs
+
+            Yields:
+                    run (tuple): Run number and the rows of the run, as
+                            (product, price, stock, sold_all_time) tuples
+        """
+        rng = random.Random(self.seed + 1)
+        prices = [product["price"] for product in self.products]
+        stocks = [product["stock"] for product in self.products]
+        sold = [0] * len(self.products)
+        for run_number in range(1, runs + 1):
+            rows = []
+            for index, product in enumerate(self.products):
+                if run_number > 1:
+                    sales = rng.randint(0, 2 * product["daily_sales"])
+                    sales = min(stocks[index], sales)
+                    stocks[index] -= sales
+                    sold[index] += sales
+                    if run_number % product["restock_every"] == 0:
+                        stocks[index] += rng.randrange(20, 200)
+                    if rng.random() < 0.02:
+                        prices[index] = (
+                            prices[index] * rng.choice(PRICE_CHANGES)
+                        ).quantize(Decimal("0.01"))
+                rows.append((product, prices[index], stocks[index], sold[index]))
+            yield run_number, rows
+
+
+def build_category_payloads(rows):
+    """
+    Encodes the rows of a run as preset-subcategory API responses.
+
+        Parameters:
+                rows (list): (product, price, stock, sold_all_time) tuples of a run
+
+        Returns:
+                payloads (dict): Maps category slug to its JSON response body (bytes)
+    """
+    categories = {category: {} for category in CATEGORIES}
+    for product, price, stock, _ in rows:
+        subcategories = categories[product["category"]]
+        subcategory = subcategories.setdefault(
+            product["subcategory_id"],
+            {
+                "id": product["subcategory_id"],
+                "title": product["subcategory"],
+                "slug": product["subcategory"].lower().replace(" ", "-"),
+                "products": [],
+            },
+        )
+        subcategory["products"].append(
+            {
+                "id": product["product_id"],
+                "title": product["product_name"],
+                "brand": product["brand"],
+                "amounts": [
+                    {"conditionId": "000000002", "amount": 0},
+                    {"conditionId": STOCK_CONDITION_ID, "amount": stock},
+                ],
+                "prices": [
+                    {"currency": "RON", "prices": [{"price": float(price), "from": 1}]}
+                ],
+                "images": [
+                    {"variants": [{"type": "large", "path": product["image"]}]}
+                ],
+            }
+        )
+    return {
+        category: json.dumps(
+            {
+                "content": list(subcategories.values()),
+                "total": sum(
+                    len(subcategory["products"])
+                    for subcategory in subcategories.values()
+                ),
+            }
+        ).encode()
+        for category, subcategories in categories.items()
+    }
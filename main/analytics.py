@@ -0,0 +1,404 @@
+from main.models import CurrentProduct, ProductAnalytics, ProductEvent, ProductHistory
+from main.runs import get_latest_run_number, get_run_dates
+from sqlalchemy import func
+from collections import namedtuple
+from datetime import datetime, timezone
+import numpy as np
+import time
+
+ANALYTICS_WINDOW_RUNS = 365  # A year of daily runs
+SHORT_WINDOW_DAYS = 7
+LONG_WINDOW_DAYS = 28
+SELL_THROUGH_DAYS = 30
+BATCH_SIZE = 5000  # Rows inserted at once
+MAX_MOVERS = 100  # Products returned by the movers API at most
+
+HistoryMatrix = namedtuple(
+    "HistoryMatrix",
+    [
+        "product_ids",
+        "categories",
+        "run_numbers",
+        "days",
+        "prices",
+        "stocks",
+        "sold_all_time",
+    ],
+)
+
+
+def load_history_matrix(db, first_run, last_run):
+    """
+    Loads the history of the current products over a run range into
+    product × run matrices, with NaN where a product was not listed in a run.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                first_run (int): First run of the range
+                last_run (int): Last run of the range
+
+        Returns:
+                matrix (HistoryMatrix): Product IDs and categories (one per row), run
+                        numbers and days (one per column) and the price, stock and
+                        sold_all_time matrices
+    """
+    histories = (
+        db.session.query(
+            ProductHistory.product_id,
+            CurrentProduct.category,
+            ProductHistory.run_numbers,
+            ProductHistory.prices,
+            ProductHistory.stocks,
+            ProductHistory.sold_all_time,
+        )
+        .join(CurrentProduct, CurrentProduct.product_id == ProductHistory.product_id)
+        .order_by(ProductHistory.product_id)
+        .all()
+    )
+    run_count = last_run - first_run + 1
+    prices = np.full((len(histories), run_count), np.nan)
+    stocks = np.full_like(prices, np.nan)
+    sold_all_time = np.full_like(prices, np.nan)
+    if histories:
+        # Scatters every product's arrays into its row in one assignment per matrix
+        lengths = np.array([len(history.run_numbers) for history in histories])
+        rows = np.repeat(np.arange(len(histories)), lengths)
+        columns = (
+            np.concatenate([history.run_numbers for history in histories]) - first_run
+        )
+        in_range = (columns >= 0) & (columns < run_count)
+        rows, columns = rows[in_range], columns[in_range]
+        for matrix, field in [
+            (prices, "prices"),
+            (stocks, "stocks"),
+            (sold_all_time, "sold_all_time"),
+        ]:
+            values = np.concatenate([getattr(history, field) for history in histories])
+            matrix[rows, columns] = values[in_range]
+        prices /= 100  # Stored in cents
+    run_numbers = np.arange(first_run, last_run + 1)
+    return HistoryMatrix(
+        np.array([history.product_id for history in histories]),
+        np.array([history.category for history in histories], dtype=object),
+        run_numbers,
+        _run_days(get_run_dates(db), run_numbers),
+        prices,
+        stocks,
+        sold_all_time,
+    )
+
+
+def _run_days(run_dates, run_numbers):
+    """
+    Gets the UTC day of each run, runs without a date take the day of the
+    closest earlier run (or the first dated run).
+    """
+    days = np.array(
+        [run_dates.get(int(run_number), "NaT") for run_number in run_numbers],
+        dtype="datetime64[D]",
+    )
+    known = ~np.isnat(days)
+    if not known.any():
+        return np.datetime64("today", "D") - np.arange(len(days))[::-1]
+    index = np.where(known, np.arange(len(days)), np.argmax(known))
+    np.maximum.accumulate(index, out=index)
+    return days[index]
+
+
+def _forward_fill(matrix):
+    """
+    Carries the last known value of each row over the runs a product was missing from.
+    """
+    index = np.where(~np.isnan(matrix), np.arange(matrix.shape[1]), 0)
+    np.maximum.accumulate(index, axis=1, out=index)
+    return matrix[np.arange(matrix.shape[0])[:, None], index]
+
+
+def _changes(matrix, present):
+    """
+    Calculates the change of each value since the previous run the product was
+    listed in, NaN in the runs it was not listed in or first appeared.
+    """
+    filled = _forward_fill(matrix)
+    changes = np.full_like(matrix, np.nan)
+    changes[:, 1:] = filled[:, 1:] - filled[:, :-1]
+    changes[~present] = np.nan
+    return changes, filled
+
+
+def _last_true(mask):
+    """
+    Finds the column of the last True value of each row, -1 for rows without one.
+    """
+    last = mask.shape[1] - 1 - np.argmax(mask[:, ::-1], axis=1)
+    return np.where(mask.any(axis=1), last, -1)
+
+
+def _window_sum(sales, day_offsets, days, skip_days=0):
+    """
+    Sums the units sold over a window of days ending skip_days before the day
+    of the last run. Runs are selected by day, whatever the number per day.
+    """
+    in_window = (day_offsets >= skip_days) & (day_offsets < skip_days + days)
+    return np.nansum(sales[:, in_window], axis=1)
+
+
+def _window_velocity(sales, present, day_offsets, days):
+    """
+    Averages the units sold per day over the last days, counted from the day
+    the product was first listed in the window.
+    """
+    in_window = day_offsets < days  # A suffix of the columns, days never decrease
+    listed = present[:, in_window]
+    listed_days = day_offsets[in_window][np.argmax(listed, axis=1)] + 1
+    sold = np.nansum(sales[:, in_window], axis=1)
+    return np.where(listed.any(axis=1), sold / listed_days, np.nan)
+
+
+def _safe_divide(numerator, denominator):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+
+def compute_product_analytics(matrix):
+    """
+    Computes sales velocity, movers, sell-through, restock and price change
+    statistics of every product as of the last run of the matrix, with array
+    operations over the whole catalogue at once. Windows span days, each run
+    counts on its UTC day, so missed or repeated runs do not stretch them.
+
+        Parameters:
+                matrix (HistoryMatrix): Product × run matrices and run days
+
+        Returns:
+                analytics (dict): Maps each ProductAnalytics column to its values
+                        (one per product)
+                events (list): Restock and price change event rows
+    """
+    present = ~np.isnan(matrix.stocks)
+    sales, _ = _changes(matrix.sold_all_time, present)
+    sales = np.clip(sales, 0, None)  # sold_all_time never decreases
+    stock_changes, stocks = _changes(matrix.stocks, present)
+    price_changes, prices = _changes(matrix.prices, present)
+
+    # Days between each run and the last one
+    day_offsets = (matrix.days[-1] - matrix.days).astype(int)
+    sold_seven_days = _window_sum(sales, day_offsets, SHORT_WINDOW_DAYS)
+    sold_previous_seven_days = _window_sum(
+        sales, day_offsets, SHORT_WINDOW_DAYS, skip_days=SHORT_WINDOW_DAYS
+    )
+    sold_thirty_days = _window_sum(sales, day_offsets, SELL_THROUGH_DAYS)
+    velocity_long = _window_velocity(sales, present, day_offsets, LONG_WINDOW_DAYS)
+    stock = stocks[:, -1]
+
+    restocks = stock_changes > 0
+    restock_count = restocks.sum(axis=1)
+    first_restock = np.argmax(restocks, axis=1)
+    last_restock = _last_true(restocks)
+    restock_interval = _safe_divide(
+        (day_offsets[first_restock] - day_offsets[last_restock]).astype(float),
+        restock_count - 1.0,
+    )
+
+    price_change_mask = np.nan_to_num(price_changes) != 0
+    last_price_change = _last_true(price_change_mask)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        price_change_ratios = price_changes / (prices - price_changes)
+    rows = np.arange(len(matrix.product_ids))
+
+    # Movers rank by the change in units sold week over week, within each category
+    sold_change = sold_seven_days - sold_previous_seven_days
+    _, category_codes = np.unique(matrix.categories.astype(str), return_inverse=True)
+    order = np.lexsort((-sold_change, category_codes))
+    sorted_codes = category_codes[order]
+    mover_rank = np.empty(len(order), dtype=int)
+    mover_rank[order] = (
+        np.arange(len(order)) - np.searchsorted(sorted_codes, sorted_codes) + 1
+    )
+
+    analytics = {
+        "product_id": matrix.product_ids,
+        "run_number": np.full(len(rows), matrix.run_numbers[-1]),
+        "category": matrix.categories,
+        "stock": stock,
+        "sold_seven_days": sold_seven_days,
+        "sold_previous_seven_days": sold_previous_seven_days,
+        "sold_thirty_days": sold_thirty_days,
+        "velocity_seven_days": _window_velocity(
+            sales, present, day_offsets, SHORT_WINDOW_DAYS
+        ),
+        "velocity_twenty_eight_days": velocity_long,
+        "week_over_week": _safe_divide(sold_change, sold_previous_seven_days),
+        "sold_change": sold_change,
+        "mover_rank": mover_rank,
+        "sell_through": _safe_divide(sold_thirty_days, sold_thirty_days + stock),
+        "days_of_stock": _safe_divide(stock, velocity_long),
+        "restock_count": restock_count,
+        "last_restock_run": np.where(
+            last_restock >= 0, matrix.run_numbers[last_restock], np.nan
+        ),
+        "restock_interval": restock_interval,
+        "price_change_count": price_change_mask.sum(axis=1),
+        "last_price_change_run": np.where(
+            last_price_change >= 0, matrix.run_numbers[last_price_change], np.nan
+        ),
+        "last_price_change": np.where(
+            last_price_change >= 0, price_change_ratios[rows, last_price_change], np.nan
+        ),
+    }
+
+    events = []
+    for kind, mask, values in [
+        ("restock", restocks, stock_changes),
+        ("price_change", price_change_mask, price_change_ratios),
+    ]:
+        event_rows, event_columns = np.nonzero(mask)
+        events.extend(
+            zip(
+                matrix.product_ids[event_rows].tolist(),
+                matrix.run_numbers[event_columns].tolist(),
+                [kind] * len(event_rows),
+                values[event_rows, event_columns].tolist(),
+            )
+        )
+    return analytics, events
+
+
+def _to_rows(analytics):
+    """
+    Converts analytics arrays into insertable rows, with None for missing values.
+    """
+    columns = {}
+    for column, values in analytics.items():
+        values = np.asarray(values)
+        if values.dtype.kind == "f":
+            missing = np.isnan(values)
+            if ProductAnalytics.__table__.c[column].type.python_type is int:
+                values = np.where(missing, 0, values).astype(int)
+            values = np.where(missing, None, values.astype(object))
+        columns[column] = values.tolist()
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+
+def run_analytics(db, last_run=None, window_runs=ANALYTICS_WINDOW_RUNS, rebuild=False):
+    """
+    Computes the analytics of the current products over a window of runs and
+    persists them for the dashboard. Events are only written for the runs
+    after the previous computation, unless the whole window is rebuilt.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                last_run (int): Run the analytics are computed as of, the latest if None
+                window_runs (int): Number of runs analysed
+                rebuild (bool): Rewrites the events of the whole window
+
+        Returns:
+                product_count (int): Number of products analysed
+    """
+    start_time = time.perf_counter()
+    if last_run is None:
+        last_run = get_latest_run_number(db)
+    if not last_run:
+        return 0
+    first_run = max(1, last_run - window_runs + 1)
+    matrix = load_history_matrix(db, first_run, last_run)
+    load_time = time.perf_counter() - start_time
+    analytics, events = compute_product_analytics(matrix)
+    compute_time = time.perf_counter() - start_time - load_time
+
+    events_since = first_run - 1
+    if not rebuild:
+        previous_run = db.session.query(func.max(ProductAnalytics.run_number)).scalar()
+        if previous_run is not None:
+            events_since = max(events_since, min(previous_run, last_run - 1))
+    db.session.query(ProductEvent).filter(
+        ProductEvent.run_number > events_since, ProductEvent.run_number <= last_run
+    ).delete(synchronize_session=False)
+    event_columns = ["product_id", "run_number", "kind", "value"]
+    event_rows = [
+        dict(zip(event_columns, event)) for event in events if event[1] > events_since
+    ]
+    db.session.query(ProductAnalytics).delete(synchronize_session=False)
+    rows = _to_rows(analytics)
+    time_computed = datetime.now(timezone.utc)
+    for row in rows:
+        row["time_computed"] = time_computed
+    for table, table_rows in [
+        (ProductAnalytics.__table__, rows),
+        (ProductEvent.__table__, event_rows),
+    ]:
+        for start in range(0, len(table_rows), BATCH_SIZE):
+            db.session.execute(table.insert(), table_rows[start : start + BATCH_SIZE])
+    db.session.commit()
+    print(
+        f"Analysed {len(rows)} products over runs {first_run}-{last_run} "
+        f"(load {load_time:.2f}s, compute {compute_time:.2f}s, "
+        f"total {time.perf_counter() - start_time:.2f}s, {len(event_rows)} events)"
+    )
+    return len(rows)
+
+
+def load_top_movers(db, category=None, limit=20):
+    """
+    Loads the products whose weekly sales grew the most, per category or overall.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                category (str): Category slug, all categories if None
+                limit (int): Number of products
+
+        Returns:
+                movers (list): Analytics and names of the top movers
+    """
+    movers = db.session.query(ProductAnalytics, CurrentProduct.product_name).join(
+        CurrentProduct, CurrentProduct.product_id == ProductAnalytics.product_id
+    )
+    if category:
+        movers = movers.filter(ProductAnalytics.category == category).order_by(
+            ProductAnalytics.mover_rank
+        )
+    else:
+        movers = movers.order_by(
+            ProductAnalytics.sold_change.desc(), ProductAnalytics.product_id
+        )
+    return [
+        {**analytics_to_dict(analytics), "product_name": product_name}
+        for analytics, product_name in movers.limit(limit)
+    ]
+
+
+def load_product_analytics(db, product_id):
+    """
+    Loads the analytics of a product and its restock and price change events.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                product_id (int): Product ID
+
+        Returns:
+                analytics (ProductAnalytics): Analytics row, None if not analysed
+                events (list): Events as dicts, oldest first
+    """
+    analytics = db.session.get(ProductAnalytics, product_id)
+    if analytics is None:
+        return None, []
+    events = (
+        db.session.query(ProductEvent)
+        .filter(ProductEvent.product_id == product_id)
+        .order_by(ProductEvent.run_number, ProductEvent.kind)
+    )
+    return analytics, [
+        {"run_number": event.run_number, "kind": event.kind, "value": event.value}
+        for event in events
+    ]
+
+
+def analytics_to_dict(analytics):
+    """
+    Converts a ProductAnalytics row into a JSON serializable dict.
+    """
+    return {
+        column.name: getattr(analytics, column.name)
+        for column in ProductAnalytics.__table__.columns
+        if column.name != "time_computed"
+    }
@@ -0,0 +1,345 @@
+from main import app, db
+from main.models import (
+    Product,
+    CurrentProduct,
+    ProductDailySales,
+    ProductSnapshot,
+    ProductSummary,
+    Run,
+)
+from main.daily_sales import get_window_end, rebuild_daily_sales, utc_day
+from main.get_products import refresh_current_products
+from main.ingestion import ingestion_lock
+from main.page_cache import clear_page_cache
+from main.runs import get_latest_run_number, invalidate_run_cache
+from main.timeseries import rebuild_product_histories
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+from sqlalchemy import bindparam, func, select
+import json
+import os
+import time
+
+BACKFILL_BATCH_SIZE = 5000  # Rows read and corrections written at once
+BACKFILL_PARTITIONS = 64  # Product ID ranges, the unit of parallelism and resumption
+WINDOWS = {"sold_thirty_days": 30, "sold_seven_days": 7}
+
+PartitionResult = namedtuple(
+    "PartitionResult", ["first_product_id", "last_product_id", "rows", "corrections"]
+)
+
+
+def _history_source():
+    """
+    Builds the stored history of the configured storage mode: its table, the
+    columns identifying a row and the counters recorded on it.
+    """
+    if app.config["STORAGE_MODE"] == "delta":
+        table = ProductSnapshot.__table__
+        statement = select(
+            table.c.product_id,
+            table.c.run_number,
+            table.c.stock,
+            table.c.sold_all_time,
+            utc_day(Run.time_started).label("day"),
+        ).join(Run, Run.run_number == table.c.run_number)
+        return table, statement, ["product_id", "run_number"], ["sold_all_time"]
+    table = Product.__table__
+    statement = select(
+        table.c.id,
+        table.c.product_id,
+        table.c.run_number,
+        table.c.stock,
+        table.c.sold_all_time,
+        table.c.sold_thirty_days,
+        table.c.sold_seven_days,
+        # History written before the runs table existed has no run
+        utc_day(func.coalesce(Run.time_started, table.c.time_created)).label("day"),
+    ).outerjoin(Run, Run.run_number == table.c.run_number)
+    return table, statement, ["id", "run_number"], ["sold_all_time", *WINDOWS]
+
+
+def plan_partitions(db, partitions=BACKFILL_PARTITIONS):
+    """
+    Splits the product IDs of the stored history into contiguous ranges.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                partitions (int): Number of ranges
+
+        Returns:
+                ranges (list): (first product ID, last product ID) tuples
+    """
+    table, _, _, _ = _history_source()
+    first_product_id, last_product_id = db.session.query(
+        func.min(table.c.product_id), func.max(table.c.product_id)
+    ).one()
+    if first_product_id is None:
+        return []
+    span = last_product_id - first_product_id + 1
+    size = max(1, -(-span // partitions))
+    return [
+        (start, min(start + size - 1, last_product_id))
+        for start in range(first_product_id, last_product_id + 1, size)
+    ]
+
+
+def _load_baselines(db, first_product_id, last_product_id):
+    """
+    Loads the last stock and sold_all_time of the products whose earlier runs
+    were compacted into summaries, the starting point of their counters.
+    """
+    summaries = (
+        db.session.query(
+            ProductSummary.product_id,
+            ProductSummary.last_stock,
+            ProductSummary.last_sold_all_time,
+        )
+        .filter(ProductSummary.product_id.between(first_product_id, last_product_id))
+        .order_by(ProductSummary.product_id, ProductSummary.last_run_number.desc())
+        .distinct(ProductSummary.product_id)
+    )
+    return {summary.product_id: summary for summary in summaries}
+
+
+def recompute_counters(rows, baselines):
+    """
+    Recomputes the sold counters of a stream of history rows in one pass.
+    Units sold between two runs are the decrease in stock, sales windows sum
+    the units sold over the days ending on the row's day, as ingestion does.
+
+        Parameters:
+                rows (iterable): History rows ordered by product ID and run number,
+                        with product_id, stock and day attributes
+                baselines (dict): Maps product ID to its latest compacted summary
+
+        Yields:
+                counters (tuple): Row and its recomputed counters (dict)
+    """
+    product_id = None
+    for row in rows:
+        if row.product_id != product_id:
+            product_id = row.product_id
+            previous = baselines.get(product_id)
+            previous_stock = previous.last_stock if previous else None
+            sold_all_time = previous.last_sold_all_time if previous else 0
+            sales = {column: deque() for column in WINDOWS}  # (day, units sold)
+            window_sold = dict.fromkeys(WINDOWS, 0)
+        sold = 0
+        if previous_stock is not None:
+            sold = max(previous_stock - row.stock, 0)
+        previous_stock = row.stock
+        sold_all_time += sold
+        for column, days in WINDOWS.items():
+            if sold:
+                sales[column].append((row.day, sold))
+                window_sold[column] += sold
+            start = row.day - timedelta(days)
+            while sales[column] and sales[column][0][0] <= start:
+                window_sold[column] -= sales[column].popleft()[1]
+        yield row, {"sold_all_time": sold_all_time, **window_sold}
+
+
+def backfill_partition(first_product_id, last_product_id, dry_run=False):
+    """
+    Recomputes the counters of a product ID range, streaming its history
+    through a server-side cursor and writing the changed rows back in batches.
+
+        Parameters:
+                first_product_id (int): First product ID of the range
+                last_product_id (int): Last product ID of the range
+                dry_run (bool): Only counts the rows that would be corrected
+
+        Returns:
+                result (PartitionResult): Rows read and corrected
+    """
+    with app.app_context():
+        table, statement, keys, counters = _history_source()
+        statement = statement.where(
+            table.c.product_id.between(first_product_id, last_product_id)
+        ).order_by(table.c.product_id, table.c.run_number)
+        correction = (
+            table.update()
+            .where(*(table.c[key] == bindparam(f"row_{key}") for key in keys))
+            .values({counter: bindparam(f"new_{counter}") for counter in counters})
+        )
+        baselines = _load_baselines(db, first_product_id, last_product_id)
+        # A separate connection keeps the cursor open while corrections are committed
+        connection = db.engine.connect()
+        result = connection.execution_options(stream_results=True).execute(statement)
+        row_count = correction_count = 0
+        corrections = []
+
+        def write_corrections():
+            if corrections and not dry_run:
+                db.session.execute(correction, corrections)
+                db.session.commit()
+            corrections.clear()
+
+        try:
+            rows = (
+                row for batch in result.partitions(BACKFILL_BATCH_SIZE) for row in batch
+            )
+            for row, values in recompute_counters(rows, baselines):
+                row_count += 1
+                if any(getattr(row, name) != values[name] for name in counters):
+                    corrections.append(
+                        {
+                            **{f"row_{key}": getattr(row, key) for key in keys},
+                            **{f"new_{name}": values[name] for name in counters},
+                        }
+                    )
+                    correction_count += 1
+                    if len(corrections) >= BACKFILL_BATCH_SIZE:
+                        write_corrections()
+            write_corrections()
+        finally:
+            result.close()
+            connection.close()
+        return PartitionResult(
+            first_product_id, last_product_id, row_count, correction_count
+        )
+
+
+def _read_state(path):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def _write_state(path, state):
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(state, file)
+    os.replace(temporary_path, path)
+
+
+def refresh_derived_data(db):
+    """
+    Rebuilds the data derived from the history counters: the daily sales
+    ledger, the per-product history arrays and the current products snapshot.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+    """
+    rebuild_daily_sales(db)
+    rebuild_product_histories(db)
+    invalidate_run_cache()
+    latest_run_number = get_latest_run_number(db)
+    if app.config["STORAGE_MODE"] == "delta":
+        end_day = get_window_end(db)
+        values = {
+            "sold_all_time": select(ProductSnapshot.sold_all_time)
+            .where(ProductSnapshot.product_id == CurrentProduct.product_id)
+            .order_by(ProductSnapshot.run_number.desc())
+            .limit(1)
+            .scalar_subquery()
+        }
+        for column, days in WINDOWS.items():
+            values[column] = (
+                select(func.coalesce(func.sum(ProductDailySales.sold), 0))
+                .where(ProductDailySales.product_id == CurrentProduct.product_id)
+                .where(ProductDailySales.day > end_day - timedelta(days))
+                .where(ProductDailySales.day <= end_day)
+                .scalar_subquery()
+            )
+        db.session.execute(CurrentProduct.__table__.update().values(values))
+    elif latest_run_number:
+        refresh_current_products(db, latest_run_number)
+    db.session.commit()
+    clear_page_cache()
+
+
+def run_backfill(
+    db, workers=1, partitions=BACKFILL_PARTITIONS, state_path=None, dry_run=False
+):
+    """
+    Recomputes sold_all_time and the sales windows of the whole stored history,
+    then rebuilds the data derived from them. The ingestion lock is held
+    throughout, so no run is written meanwhile. Product ID ranges are processed
+    in a process pool when workers is above 1. The planned and completed
+    ranges are recorded in the state file, so an interrupted backfill resumes
+    where it stopped.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                workers (int): Number of processes
+                partitions (int): Number of product ID ranges
+                state_path (str): File recording the completed ranges
+                dry_run (bool): Only reports the rows that would be corrected
+
+        Returns:
+                corrections (int): Number of rows corrected, None if the backfill
+                        was skipped
+    """
+    with ingestion_lock(db) as locked:
+        if not locked:
+            print("An ingestion or backfill is running, skipping...")
+            return None
+        state = {} if dry_run else _read_state(state_path)
+        if state.get("partitions") != partitions or "ranges" not in state:
+            # Planned once, product IDs added before a resume must not move the
+            # boundaries of the ranges already done
+            state = {
+                "partitions": partitions,
+                "ranges": plan_partitions(db, partitions),
+                "completed": [],
+            }
+            if not dry_run and state_path:
+                _write_state(state_path, state)
+        ranges = [
+            (first_product_id, last_product_id)
+            for first_product_id, last_product_id in state["ranges"]
+            if f"{first_product_id}-{last_product_id}" not in state["completed"]
+        ]
+        completed_count = len(state["completed"])
+        total_count = completed_count + len(ranges)
+        if completed_count:
+            print(f"Resuming backfill, {completed_count}/{total_count} ranges done...")
+        start_time = time.perf_counter()
+        row_count = correction_count = 0
+
+        def record(result):
+            nonlocal row_count, correction_count, completed_count
+            row_count += result.rows
+            correction_count += result.corrections
+            completed_count += 1
+            if not dry_run and state_path:
+                state["completed"].append(
+                    f"{result.first_product_id}-{result.last_product_id}"
+                )
+                _write_state(state_path, state)
+            elapsed = time.perf_counter() - start_time
+            print(
+                f"[{completed_count}/{total_count}] products "
+                f"{result.first_product_id}-{result.last_product_id}: "
+                f"{result.rows} rows, {result.corrections} corrections "
+                f"({row_count / elapsed if elapsed else 0:.0f} rows/s)"
+            )
+
+        if workers > 1 and len(ranges) > 1:
+            # Forked processes must not share the parent's connections, the
+            # lock's connection is checked out so disposing keeps it open
+            db.session.remove()
+            db.engine.dispose()
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(backfill_partition, *product_ids, dry_run)
+                    for product_ids in ranges
+                ]
+                for future in as_completed(futures):
+                    record(future.result())
+        else:
+            for product_ids in ranges:
+                record(backfill_partition(*product_ids, dry_run))
+
+        verb = "Found" if dry_run else "Corrected"
+        print(f"{verb} {correction_count} of {row_count} rows...")
+        if not dry_run:
+            print("Rebuilding daily sales, histories and current products...")
+            refresh_derived_data(db)
+            if state_path and os.path.exists(state_path):
+                os.remove(state_path)
+        return correction_count
@@ -1,6 +1,41 @@
-from main.models import Product
-from main.get_products import calculate_current_run_number
+from main.models import CurrentProduct
+from main.search import search_products, order_by_relevance
+from main.daily_sales import get_window_end, parse_window_sort, query_window_sold
 from main import db
+from sqlalchemy import func, tuple_
+from decimal import Decimal, InvalidOperation
+from collections import namedtuple
+
+ProductStats = namedtuple(
+    "ProductStats",
+    ["total_products", "total_sold", "thirty_days_sold", "seven_days_sold"],
+)
+
+
+def calculate_product_stats(products):
+    """
+    Calculates the total number of products and the number of products sold
+    all time, in the last thirty days and in the last seven days
+    in a single SQL statement.
+
+    Parameters:
+            products (Query): Filtered (and optionally sorted) products query
+
+    Returns:
+            stats (ProductStats): Totals over the filtered products
+    """
+    model = products.column_descriptions[0]["entity"]  # Product or CurrentProduct
+    row = (
+        products.order_by(None)
+        .with_entities(
+            func.count(model.id),
+            func.coalesce(func.sum(model.sold_all_time), 0),
+            func.coalesce(func.sum(model.sold_thirty_days), 0),
+            func.coalesce(func.sum(model.sold_seven_days), 0),
+        )
+        .one()
+    )
+    return ProductStats(*(int(value) for value in row))
 
 
 def calculate_total_items(products):
@@ -11,8 +46,7 @@ def calculate_total_items(products):
     Returns:
             total_products(int): Total number of products
     """
-    total_products = len(products.all())
-    return total_products
+    return calculate_product_stats(products).total_products
 
 
 def calculate_total_sold(products):
@@ -23,10 +57,7 @@ def calculate_total_sold(products):
     Returns:
             total_sold (int): Total number of sold products
     """
-    total_sold = 0
-    for product in products.all():
-        total_sold += product.sold_all_time
-    return total_sold
+    return calculate_product_stats(products).total_sold
 
 
 def calculate_sold_thirty_days(products):
@@ -37,10 +68,7 @@ def calculate_sold_thirty_days(products):
     Returns:
             thirty_days_sold (int): Number of products sold in thirty days
     """
-    thirty_days_sold = 0
-    for product in products.all():
-        thirty_days_sold += product.sold_thirty_days
-    return thirty_days_sold
+    return calculate_product_stats(products).thirty_days_sold
 
 
 def calculate_sold_seven_days(products):
@@ -51,10 +79,154 @@ def calculate_sold_seven_days(products):
     Returns:
             seven_days_sold (int): Number of products sold in seven days
     """
-    seven_days_sold = 0
-    for product in products.all():
-        seven_days_sold += product.sold_seven_days
-    return seven_days_sold
+    return calculate_product_stats(products).seven_days_sold
+
+
+# Column and direction (descending) each sort type orders products by
+SORT_COLUMNS = {
+    "total-highest": (CurrentProduct.sold_all_time, True),
+    "total-lowest": (CurrentProduct.sold_all_time, False),
+    "thirty-days-highest": (CurrentProduct.sold_thirty_days, True),
+    "thirty-days-lowest": (CurrentProduct.sold_thirty_days, False),
+    "seven-days-highest": (CurrentProduct.sold_seven_days, True),
+    "seven-days-lowest": (CurrentProduct.sold_seven_days, False),
+    "price-highest": (CurrentProduct.price, True),
+    "price-lowest": (CurrentProduct.price, False),
+}
+
+
+def sort_products(products, sort):
+    """
+    Sorts products by the specified sort type. Ties are broken by product ID,
+    so the order is stable and can be paginated with a cursor. Custom sales
+    windows ("14-days-highest"...) are summed from the daily sales ledger.
+
+    Parameters:
+            products (Query): Current products query
+            sort (str): Sort type (total-highest, price-lowest, 14-days-highest...)
+
+    Returns:
+            sorted_products (Query): Sorted products query
+    """
+    window = parse_window_sort(sort)
+    if window is not None:
+        days, descending = window
+        window_sold = query_window_sold(days, get_window_end(db))
+        products = products.outerjoin(
+            window_sold, window_sold.c.product_id == CurrentProduct.product_id
+        )
+        column = func.coalesce(window_sold.c.sold, 0)
+    else:
+        column, descending = SORT_COLUMNS.get(sort, SORT_COLUMNS["total-highest"])
+    if descending:
+        return products.order_by(column.desc(), CurrentProduct.product_id.desc())
+    return products.order_by(column.asc(), CurrentProduct.product_id.asc())
+
+
+def seek_products(products, sort, cursor):
+    """
+    Filters sorted products to the ones that come after the cursor (keyset pagination).
+
+    Parameters:
+            products (Query): Products query sorted with sort_products
+            sort (str): Sort type (total-highest, price-lowest...)
+            cursor (tuple): Sort column value and product ID of the last product seen
+
+    Returns:
+            remaining_products (Query): Products after the cursor
+    """
+    column, descending = SORT_COLUMNS.get(sort, SORT_COLUMNS["total-highest"])
+    keyset = tuple_(column, CurrentProduct.product_id)
+    if descending:
+        return products.filter(keyset < tuple_(*cursor))
+    return products.filter(keyset > tuple_(*cursor))
+
+
+def encode_cursor(sort, product):
+    """
+    Encodes the position of a product in the sort order for use in URLs.
+
+    Parameters:
+            sort (str): Sort type (total-highest, price-lowest...)
+            product (dict): Product column values
+
+    Returns:
+            cursor (str): Sort column value and product ID, e.g. "129.90_41023"
+    """
+    column, descending = SORT_COLUMNS.get(sort, SORT_COLUMNS["total-highest"])
+    return f"{product[column.key]}_{product['product_id']}"
+
+
+def decode_cursor(sort, cursor):
+    """
+    Decodes a cursor created by encode_cursor.
+
+    Parameters:
+            sort (str): Sort type (total-highest, price-lowest...)
+            cursor (str): Encoded cursor
+
+    Returns:
+            cursor (tuple): Sort column value and product ID, None if the cursor is invalid
+    """
+    if sort not in SORT_COLUMNS or not cursor:
+        return None
+    column, descending = SORT_COLUMNS[sort]
+    try:
+        value, product_id = cursor.split("_")
+        if column.key == "price":
+            return Decimal(value), int(product_id)
+        return int(value), int(product_id)
+    except (ValueError, InvalidOperation):
+        return None
+
+
+def query_category_products(filter, sort):
+    """
+    Builds the query for the current products of a category.
+
+    Parameters:
+            filter (str): Category slug, or "all-products"
+            sort (str): Sort type (total-highest, price-lowest...)
+
+    Returns:
+            products (Query): Filtered and sorted products query
+    """
+    products = CurrentProduct.query
+    if filter != "all-products":
+        products = products.filter(CurrentProduct.category == filter)
+    return sort_products(products, sort)
+
+
+def query_brand_products(filter, sort):
+    """
+    Builds the query for the current products of a brand.
+
+    Parameters:
+            filter (str): Brand name
+            sort (str): Sort type (total-highest, price-lowest...)
+
+    Returns:
+            products (Query): Filtered and sorted products query
+    """
+    products = CurrentProduct.query.filter(CurrentProduct.brand == filter)
+    return sort_products(products, sort)
+
+
+def query_searched_products(term, sort):
+    """
+    Builds the query for the current products matching the searched term.
+
+    Parameters:
+            term (str): Searched term
+            sort (str): Sort type (total-highest, price-lowest, relevance...)
+
+    Returns:
+            products (Query): Filtered and sorted products query
+    """
+    products = search_products(CurrentProduct.query, term)
+    if sort == "relevance":
+        return order_by_relevance(products, term)
+    return sort_products(products, sort)
 
 
 def map_category(filter):
@@ -76,6 +248,10 @@ def map_category(filter):
 
 
 def map_sort(sort):
+    window = parse_window_sort(sort)
+    if window is not None:
+        days, descending = window
+        return f"{'Most' if descending else 'Least'} Sold - {days} Days"
     sort_mapping = {
         "total-highest": "Most Sold - All Time",
         "total-lowest": "Least Sold - All Time",
@@ -85,5 +261,6 @@ def map_sort(sort):
         "seven-days-lowest": "Least Sold - 7 Days",
         "price-highest": "Most Expensive",
         "price-lowest": "Least Expensive",
+        "relevance": "Most Relevant",
     }
     return sort_mapping[sort]
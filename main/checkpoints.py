@@ -0,0 +1,100 @@
+from main import app
+from datetime import datetime, timezone
+import json
+import os
+import shutil
+import threading
+
+
+def checkpoint_dir(day=None):
+    """
+    Gets the directory holding the category checkpoints of a day's ingestion.
+
+        Parameters:
+                day (date): Day of the ingestion, today (UTC) if not specified
+
+        Returns:
+                path (str): Checkpoint directory
+    """
+    if day is None:
+        day = datetime.now(timezone.utc).date()
+    return os.path.join(app.config["INGEST_CHECKPOINT_DIR"], day.isoformat())
+
+
+def checkpoint_path(category, day=None):
+    """
+    Gets the path of a category's checkpoint, a JSON lines file of product records.
+    """
+    return os.path.join(checkpoint_dir(day), f"{category}.jsonl")
+
+
+def has_checkpoint(category, day=None):
+    """
+    Checks whether a category has already been fetched completely.
+    """
+    return os.path.exists(checkpoint_path(category, day))
+
+
+def write_checkpoint(category, rows, day=None):
+    """
+    Streams the rows of a category into its checkpoint. The checkpoint only
+    becomes visible once every row has been written, so a failed download
+    never leaves a partial category behind.
+
+        Parameters:
+                category (str): Getic's category slug
+                rows (iterable): JSON serializable rows
+                day (date): Day of the ingestion, today (UTC) if not specified
+
+        Returns:
+                row_count (int): Number of rows written
+    """
+    path = checkpoint_path(category, day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    row_count = 0
+    try:
+        with open(temporary_path, "w") as file:
+            for row in rows:
+                file.write(json.dumps(row) + "\n")
+                row_count += 1
+        os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+    return row_count
+
+
+def read_checkpoint(category, day=None):
+    """
+    Reads the rows of a category's checkpoint back one at a time.
+
+        Parameters:
+                category (str): Getic's category slug
+                day (date): Day of the ingestion, today (UTC) if not specified
+
+        Yields:
+                row (list): Row as it was written
+    """
+    with open(checkpoint_path(category, day)) as file:
+        for line in file:
+            yield json.loads(line)
+
+
+def clear_checkpoints(keep_today=False):
+    """
+    Removes the category checkpoints, once their run has been written
+    or when they were left behind by an ingestion on an earlier day.
+
+        Parameters:
+                keep_today (bool): Keeps the checkpoints of today's ingestion
+    """
+    root = app.config["INGEST_CHECKPOINT_DIR"]
+    if not os.path.isdir(root):
+        return
+    today = checkpoint_dir()
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if keep_today and path == today:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
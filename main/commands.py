@@ -0,0 +1,174 @@
+from main import app, db
+from main.analytics import ANALYTICS_WINDOW_RUNS, run_analytics
+from main.backfill import BACKFILL_PARTITIONS, run_backfill
+from main.daily_sales import rebuild_daily_sales
+from main.exports import (
+    EXPORT_FORMATS,
+    iter_export_batches,
+    export_products,
+    parquet_available,
+)
+from main.get_products import load_proxy_pool
+from main.history import compact_history
+from main.images import sync_product_images
+from main.ingestion import run_ingestion
+from main.timeseries import rebuild_product_histories
+import click
+import os
+
+
+@app.cli.command("compact-history")
+@click.option(
+    "--horizon-days",
+    type=int,
+    default=None,
+    help="Age in days after which snapshots are compacted (HISTORY_HORIZON_DAYS).",
+)
+@click.option(
+    "--period",
+    type=click.Choice(["week", "month"]),
+    default="month",
+    help="Period snapshots are summarized by.",
+)
+@click.option("--dry-run", is_flag=True, help="Only reports the space reclaimed.")
+@click.option(
+    "--drop", is_flag=True, help="Drops old partitions instead of archiving them."
+)
+def compact_history_command(horizon_days, period, dry_run, drop):
+    """
+    Rolls old product snapshots up into summaries and removes the raw rows.
+    """
+    if horizon_days is None:
+        horizon_days = app.config["HISTORY_HORIZON_DAYS"]
+    compact_history(db, horizon_days, period, dry_run, drop)
+
+
+@app.cli.command("sync-images")
+@click.option("--workers", type=int, default=8, help="Concurrent downloads.")
+@click.option(
+    "--revalidate", is_flag=True, help="Also checks unchanged URLs for new content."
+)
+def sync_images_command(workers, revalidate):
+    """
+    Downloads new and changed product images and generates their thumbnails.
+    """
+    sync_product_images(db, max_workers=workers, revalidate=revalidate)
+
+
+@app.cli.command("probe-proxies")
+def probe_proxies_command():
+    """
+    Probes the configured proxies (PROXY_LIST or ProxyScrape) and lists their scores.
+    """
+    for stats in load_proxy_pool().stats():
+        latency = "-" if stats.latency is None else f"{stats.latency * 1000:.0f}ms"
+        print(
+            f"{stats.proxy:<40} {latency:>8} {stats.success_rate:>6.0%} "
+            f"{'ejected' if stats.ejected_until else 'healthy'}"
+        )
+
+
+@app.cli.command("rebuild-histories")
+def rebuild_histories_command():
+    """
+    Rebuilds the per-product history arrays from the stored snapshots.
+    """
+    rebuild_product_histories(db)
+
+
+@app.cli.command("rebuild-daily-sales")
+def rebuild_daily_sales_command():
+    """
+    Rebuilds the daily sales ledger from the stored history.
+    """
+    row_count = rebuild_daily_sales(db)
+    print(f"Daily sales ledger rebuilt with {row_count} rows...")
+
+
+@app.cli.command("backfill-counters")
+@click.option("--workers", type=int, default=1, help="Processes recomputing ranges.")
+@click.option(
+    "--partitions",
+    type=int,
+    default=BACKFILL_PARTITIONS,
+    help="Product ID ranges, each one is committed and resumable on its own.",
+)
+@click.option("--restart", is_flag=True, help="Ignores the ranges already done.")
+@click.option("--dry-run", is_flag=True, help="Only reports the rows to correct.")
+def backfill_counters_command(workers, partitions, restart, dry_run):
+    """
+    Recomputes the sold counters of the whole history in one pass, then rebuilds
+    the daily sales, histories and current products. Resumes when run again.
+    """
+    state_path = app.config["BACKFILL_STATE_FILE"]
+    if restart and os.path.exists(state_path):
+        os.remove(state_path)
+    run_backfill(
+        db,
+        workers=workers,
+        partitions=partitions,
+        state_path=state_path,
+        dry_run=dry_run,
+    )
+
+
+@app.cli.command("compute-analytics")
+@click.option(
+    "--window-runs",
+    type=int,
+    default=ANALYTICS_WINDOW_RUNS,
+    help="Number of runs analysed.",
+)
+@click.option("--rebuild", is_flag=True, help="Rewrites the events of the window.")
+def compute_analytics_command(window_runs, rebuild):
+    """
+    Computes sales velocity, movers and restock analytics as of the latest run.
+    """
+    run_analytics(db, window_runs=window_runs, rebuild=rebuild)
+
+
+@app.cli.command("export-products")
+@click.argument("output")
+@click.option(
+    "--format",
+    type=click.Choice(list(EXPORT_FORMATS)),
+    default="csv",
+    help="Export format.",
+)
+@click.option("--run", "run_number", type=int, help="Run to export.")
+@click.option("--start-date", type=click.DateTime(["%Y-%m-%d"]), help="First day.")
+@click.option("--end-date", type=click.DateTime(["%Y-%m-%d"]), help="Last day.")
+@click.option("--category", help="Category slug.")
+@click.option("--brand", help="Brand name.")
+@click.option("--search", "term", help="Searched term.")
+@click.option("--sort", help="Sort of the current products (total-highest...).")
+def export_products_command(
+    output, format, run_number, start_date, end_date, category, brand, term, sort
+):
+    """
+    Exports current products, a run or a date range of the history to OUTPUT.
+    """
+    if format == "parquet" and not parquet_available():
+        raise click.ClickException("Parquet exports require pyarrow")
+    batches = iter_export_batches(
+        run_number=run_number,
+        start_date=start_date.date() if start_date else None,
+        end_date=end_date.date() if end_date else None,
+        category=category,
+        brand=brand,
+        term=term,
+        sort=sort,
+    )
+    row_count = export_products(output, format, batches)
+    print(f"Exported {row_count} rows to {output}...")
+
+
+@app.cli.command("ingest")
+@click.option("--proxies", is_flag=True, help="Makes the requests through proxies.")
+@click.option("--skip-images", is_flag=True, help="Does not sync product images.")
+def ingest_command(proxies, skip_images):
+    """
+    Runs an ingestion, unless one is already running. Usable from cron or systemd,
+    a failed ingestion exits with an error and resumes when run again that day.
+    """
+    run_ingestion(use_proxies=proxies, sync_images=not skip_images)
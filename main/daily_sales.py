@@ -0,0 +1,175 @@
+from main.models import Product, ProductDailySales, ProductSnapshot, Run
+from main.runs import get_latest_run_number, get_run_dates, run_day
+from sqlalchemy import Date, cast, func, select, union_all
+from sqlalchemy.dialects import postgresql
+from datetime import date, datetime, timedelta, timezone
+import re
+
+MAX_WINDOW_DAYS = 365  # Longest custom sales window
+WINDOW_SORT_PATTERN = re.compile(r"^(\d+)-days-(highest|lowest)$")
+
+
+def parse_window_sort(sort):
+    """
+    Parses a custom sales window sort type, e.g. "14-days-highest".
+
+        Parameters:
+                sort (str): Sort type
+
+        Returns:
+                window (tuple): Window length in days and whether the order is
+                        descending, None if the sort is not a valid window sort
+    """
+    match = WINDOW_SORT_PATTERN.match(sort or "")
+    if match is None:
+        return None
+    days = int(match.group(1))
+    if not 1 <= days <= MAX_WINDOW_DAYS:
+        return None
+    return days, match.group(2) == "highest"
+
+
+def utc_day(column):
+    """
+    Builds the SQL expression of run_day for a timestamp column.
+    """
+    return cast(func.timezone("UTC", column), Date)
+
+
+def get_window_end(db):
+    """
+    Gets the day sales windows of the dashboard end on, the day of the latest run.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+
+        Returns:
+                window_end (date): Last day of the windows
+    """
+    run_date = get_run_dates(db).get(get_latest_run_number(db))
+    if run_date is None:
+        return run_day(datetime.now(timezone.utc))
+    return date.fromisoformat(run_date)
+
+
+def query_window_sold(days, end_day):
+    """
+    Builds a subquery summing the units each product sold over a window of days.
+    Only the ledger rows of the window are read, through the day index.
+
+        Parameters:
+                days (int): Window length in days, end day included
+                end_day (date): Last day of the window
+
+        Returns:
+                window_sold (Subquery): product_id and sold columns
+    """
+    return (
+        select(
+            ProductDailySales.product_id,
+            func.sum(ProductDailySales.sold).label("sold"),
+        )
+        .where(ProductDailySales.day > end_day - timedelta(days))
+        .where(ProductDailySales.day <= end_day)
+        .group_by(ProductDailySales.product_id)
+        .subquery()
+    )
+
+
+def load_window_sold(db, days, end_day):
+    """
+    Loads how many units each product sold over a window of days. Days without
+    a run count as no sales, so a missed run does not reset the window.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                days (int): Window length in days, end day included
+                end_day (date): Last day of the window
+
+        Returns:
+                window_sold (dict): Maps product ID to units sold, products
+                        without sales are missing
+    """
+    window_sold = query_window_sold(days, end_day)
+    rows = db.session.execute(select(window_sold))
+    return {product_id: int(sold) for product_id, sold in rows}
+
+
+def write_daily_sales(db, rows):
+    """
+    Adds the units sold by a run to the ledger rows of its day. Several runs on
+    the same day accumulate into one row. Nothing is committed.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                rows (list): Dicts with product_id, day and sold (greater than 0)
+    """
+    if not rows:
+        return
+    insert = postgresql.insert(ProductDailySales.__table__)
+    db.session.execute(
+        insert.on_conflict_do_update(
+            index_elements=["product_id", "day"],
+            set_={"sold": ProductDailySales.__table__.c.sold + insert.excluded.sold},
+        ),
+        rows,
+    )
+
+
+def rebuild_daily_sales(db):
+    """
+    Rebuilds the ledger from the stored history: the units sold on a day are the
+    growth of sold_all_time since the last day the product was recorded on.
+    Both the products table and the delta snapshots are read, so history written
+    before switching storage modes is included.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+
+        Returns:
+                row_count (int): Number of ledger rows written
+    """
+    history = union_all(
+        select(
+            Product.product_id,
+            # History written before the runs table existed has no run
+            utc_day(func.coalesce(Run.time_started, Product.time_created)).label(
+                "day"
+            ),
+            Product.sold_all_time,
+        ).outerjoin(Run, Run.run_number == Product.run_number),
+        select(
+            ProductSnapshot.product_id,
+            utc_day(Run.time_started),
+            ProductSnapshot.sold_all_time,
+        ).join(Run, Run.run_number == ProductSnapshot.run_number),
+    ).subquery()
+    days = (
+        select(
+            history.c.product_id,
+            history.c.day,
+            func.min(history.c.sold_all_time).label("first_sold_all_time"),
+            func.max(history.c.sold_all_time).label("last_sold_all_time"),
+        )
+        .group_by(history.c.product_id, history.c.day)
+        .subquery()
+    )
+    previous_sold_all_time = func.lag(days.c.last_sold_all_time).over(
+        partition_by=days.c.product_id, order_by=days.c.day
+    )
+    ledger = select(
+        days.c.product_id,
+        days.c.day,
+        (
+            days.c.last_sold_all_time
+            - func.coalesce(previous_sold_all_time, days.c.first_sold_all_time)
+        ).label("sold"),
+    ).subquery()
+    db.session.execute(ProductDailySales.__table__.delete())
+    result = db.session.execute(
+        ProductDailySales.__table__.insert().from_select(
+            ["product_id", "day", "sold"], select(ledger).where(ledger.c.sold > 0)
+        )
+    )
+    db.session.commit()
+    return result.rowcount
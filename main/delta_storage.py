@@ -0,0 +1,98 @@
+from main.models import ProductDetails, ProductSnapshot, Run
+from main.daily_sales import load_window_sold
+from main.runs import run_day
+from sqlalchemy import and_, func, select
+
+
+def _latest_snapshots(run_number=None):
+    """
+    Builds a subquery selecting the run of each product's latest snapshot,
+    up to and including the specified run.
+    """
+    latest_runs = select(
+        ProductSnapshot.product_id,
+        func.max(ProductSnapshot.run_number).label("run_number"),
+    ).group_by(ProductSnapshot.product_id)
+    if run_number is not None:
+        latest_runs = latest_runs.where(ProductSnapshot.run_number <= run_number)
+    return latest_runs.subquery()
+
+
+def load_latest_snapshots(db, run_number=None):
+    """
+    Loads the latest snapshot of every product in a single query.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                run_number (int): Last run to consider, all runs if not specified
+
+        Returns:
+                latest_snapshots (dict): Maps product ID to its latest ProductSnapshot row
+    """
+    latest_runs = _latest_snapshots(run_number)
+    snapshots = db.session.query(
+        ProductSnapshot.product_id,
+        ProductSnapshot.price,
+        ProductSnapshot.stock,
+        ProductSnapshot.sold_all_time,
+        ProductSnapshot.removed,
+    ).join(
+        latest_runs,
+        and_(
+            ProductSnapshot.product_id == latest_runs.c.product_id,
+            ProductSnapshot.run_number == latest_runs.c.run_number,
+        ),
+    )
+    return {snapshot.product_id: snapshot for snapshot in snapshots}
+
+
+def load_run_snapshot(db, run_number):
+    """
+    Reconstructs the full snapshot of a run from the delta tables.
+    Static attributes are the latest known ones, sold counters in
+    thirty and seven days are summed from the daily sales ledger.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                run_number (int): Run to reconstruct
+
+        Yields:
+                product (dict): Product columns, as stored in the products table
+    """
+    run_date = run_day(
+        db.session.query(Run.time_started)
+        .filter(Run.run_number == run_number)
+        .scalar()
+    )
+    thirty_days_sold = load_window_sold(db, 30, run_date)
+    seven_days_sold = load_window_sold(db, 7, run_date)
+    latest_runs = _latest_snapshots(run_number)
+    products = (
+        db.session.query(ProductDetails, ProductSnapshot)
+        .join(ProductSnapshot, ProductSnapshot.product_id == ProductDetails.product_id)
+        .join(
+            latest_runs,
+            and_(
+                ProductSnapshot.product_id == latest_runs.c.product_id,
+                ProductSnapshot.run_number == latest_runs.c.run_number,
+            ),
+        )
+        .filter(ProductSnapshot.removed.is_(False))
+        .order_by(ProductDetails.product_id)
+    )
+    for details, snapshot in products.yield_per(1000):
+        yield {
+            "product_id": details.product_id,
+            "product_name": details.product_name,
+            "brand": details.brand,
+            "category": details.category,
+            "subcategory": details.subcategory,
+            "subcategory_id": details.subcategory_id,
+            "price": snapshot.price,
+            "stock": snapshot.stock,
+            "sold_all_time": snapshot.sold_all_time,
+            "sold_thirty_days": thirty_days_sold.get(details.product_id, 0),
+            "sold_seven_days": seven_days_sold.get(details.product_id, 0),
+            "image": details.image,
+            "run_number": run_number,
+        }
@@ -0,0 +1,271 @@
+from main import app, db
+from main.models import CurrentProduct, Product
+from main.calculate_stats import sort_products
+from main.delta_storage import load_run_snapshot
+from main.runs import select_run_numbers
+from main.search import escape_like
+from sqlalchemy import select
+import csv
+import importlib.util
+import io
+
+EXPORT_BATCH_SIZE = 5000  # Rows fetched from the server-side cursor at once
+EXPORT_FORMATS = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+EXPORT_COLUMNS = [
+    column.name for column in Product.__table__.columns if column.name != "id"
+]
+
+
+def _filter_products(products, model, category=None, brand=None, term=None):
+    """
+    Applies the dashboard filters (category, brand and searched term) to a query.
+    """
+    if category and category != "all-products":
+        products = products.where(model.category == category)
+    if brand:
+        products = products.where(model.brand == brand)
+    if term:
+        products = products.where(
+            model.product_name.ilike(f"%{escape_like(term)}%", escape="\\")
+        )
+    return products
+
+
+def _stream_rows(statement, batch_size):
+    """
+    Executes a statement on a server-side cursor and yields its rows in batches.
+    """
+    result = db.session.execute(statement.execution_options(stream_results=True))
+    try:
+        for rows in result.partitions(batch_size):
+            yield [tuple(row) for row in rows]
+    finally:
+        result.close()
+
+
+def _stream_delta_rows(run_numbers, category, brand, term, batch_size):
+    """
+    Reconstructs the snapshots of the specified runs from the delta tables
+    and yields the rows matching the dashboard filters in batches.
+    """
+    rows = []
+    for run_number in run_numbers:
+        for product in load_run_snapshot(db, run_number):
+            if category and category != "all-products":
+                if product["category"] != category:
+                    continue
+            if brand and product["brand"] != brand:
+                continue
+            if term and term.lower() not in product["product_name"].lower():
+                continue
+            rows.append(tuple(product.get(column) for column in EXPORT_COLUMNS))
+            if len(rows) == batch_size:
+                yield rows
+                rows = []
+    if rows:
+        yield rows
+
+
+def iter_export_batches(
+    run_number=None,
+    start_date=None,
+    end_date=None,
+    category=None,
+    brand=None,
+    term=None,
+    sort=None,
+    batch_size=EXPORT_BATCH_SIZE,
+):
+    """
+    Streams product snapshots matching the filters, in batches of rows ordered as
+    EXPORT_COLUMNS. Without a run or a date range the current products are
+    exported in the dashboard's sort order, otherwise the history of the
+    completed runs is exported ordered by run and product.
+
+        Parameters:
+                run_number (int): Run to export
+                start_date (date): First UTC day of the runs to export
+                end_date (date): Last UTC day of the runs to export (inclusive)
+                category (str): Category slug, or "all-products"
+                brand (str): Brand name
+                term (str): Searched term
+                sort (str): Sort type of the current products (total-highest...)
+                batch_size (int): Number of rows per batch
+
+        Yields:
+                rows (list): Batch of row tuples
+    """
+    if run_number is None and start_date is None and end_date is None:
+        columns = [CurrentProduct.__table__.c[column] for column in EXPORT_COLUMNS]
+        products = _filter_products(
+            select(*columns), CurrentProduct, category, brand, term
+        )
+        yield from _stream_rows(sort_products(products, sort), batch_size)
+        return
+
+    run_numbers = select_run_numbers(db, run_number, start_date, end_date)
+    if app.config["STORAGE_MODE"] == "delta":
+        yield from _stream_delta_rows(run_numbers, category, brand, term, batch_size)
+        return
+
+    columns = [Product.__table__.c[column] for column in EXPORT_COLUMNS]
+    products = _filter_products(select(*columns), Product, category, brand, term)
+    # A list of run numbers lets the planner prune the products partitions
+    products = products.where(Product.run_number.in_(run_numbers))
+    products = products.order_by(Product.run_number, Product.product_id)
+    yield from _stream_rows(products, batch_size)
+
+
+def iter_csv_chunks(batches):
+    """
+    Encodes batches of rows as CSV, one chunk of text per batch.
+
+        Parameters:
+                batches (iterable): Batches of row tuples ordered as EXPORT_COLUMNS
+
+        Yields:
+                chunk (str): CSV text, starting with the header
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file collecting the bytes written since it was last drained.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def parquet_available():
+    """
+    Checks that pyarrow, the optional dependency of Parquet exports, is installed.
+    """
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def parquet_schema():
+    """
+    Builds the Parquet schema of the exported columns.
+    """
+    import pyarrow as pa  # Only needed for Parquet exports
+
+    types = {
+        "price": pa.decimal128(10, 2),
+        "time_created": pa.timestamp("us", tz="UTC"),
+    }
+    return pa.schema(
+        [
+            (
+                column.name,
+                types.get(
+                    column.name,
+                    pa.int32() if column.type.python_type is int else pa.string(),
+                ),
+            )
+            for column in Product.__table__.columns
+            if column.name in EXPORT_COLUMNS
+        ]
+    )
+
+
+def write_parquet(file, batches):
+    """
+    Writes batches of rows to a Parquet file, one row group per batch.
+
+        Parameters:
+                file (str or file-like object): Destination
+                batches (iterable): Batches of row tuples ordered as EXPORT_COLUMNS
+
+        Yields:
+                row_count (int): Number of rows written in each row group
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    with pq.ParquetWriter(file, schema, compression="zstd") as writer:
+        for rows in batches:
+            columns = list(zip(*rows))
+            writer.write_table(
+                pa.Table.from_arrays(
+                    [
+                        pa.array(values, type=field.type)
+                        for values, field in zip(columns, schema)
+                    ],
+                    schema=schema,
+                )
+            )
+            yield len(rows)
+
+
+def iter_parquet_chunks(batches):
+    """
+    Encodes batches of rows as a Parquet file streamed one row group at a time.
+
+        Parameters:
+                batches (iterable): Batches of row tuples ordered as EXPORT_COLUMNS
+
+        Yields:
+                chunk (bytes): Parquet bytes, the footer comes with the last chunk
+    """
+    sink = _ChunkSink()
+    for _ in write_parquet(sink, batches):
+        yield sink.drain()
+    yield sink.drain()
+
+
+def export_products(file, format, batches):
+    """
+    Writes an export to a file.
+
+        Parameters:
+                file (str): Destination path
+                format (str): Export format ("csv" or "parquet")
+                batches (iterable): Batches of row tuples ordered as EXPORT_COLUMNS
+
+        Returns:
+                row_count (int): Number of rows exported
+    """
+    row_count = 0
+
+    def count(batches):
+        nonlocal row_count
+        for rows in batches:
+            row_count += len(rows)
+            yield rows
+
+    if format == "parquet":
+        for _ in write_parquet(file, count(batches)):
+            pass
+    else:
+        with open(file, "w", newline="") as csv_file:
+            for chunk in iter_csv_chunks(count(batches)):
+                csv_file.write(chunk)
+    return row_count
@@ -0,0 +1,287 @@
+from main.models import CurrentProduct, ProductFacet
+from main.calculate_stats import map_category, sort_products
+from main.search import search_products, order_by_relevance
+from sqlalchemy import func, tuple_
+from decimal import Decimal, InvalidOperation
+
+FACET_DIMENSIONS = ["category", "subcategory", "brand"]
+MAX_PER_PAGE = 200
+MAX_FILTER_VALUES = 50  # Values of one facet a request can combine
+
+
+def parse_facet_filters(args):
+    """
+    Parses the filters of a faceted products request. Facets can be repeated
+    to combine several values (?brand=A&brand=B).
+
+        Parameters:
+                args (MultiDict): Query string arguments
+
+        Returns:
+                filters (dict): Categories, subcategory IDs and brands (lists),
+                        price bounds (Decimal), in_stock (bool) and searched term
+
+        Raises:
+                ValueError: An argument is not valid
+    """
+    filters = {
+        "category": args.getlist("category"),
+        "subcategory": [int(value) for value in args.getlist("subcategory")],
+        "brand": args.getlist("brand"),
+        "min_price": None,
+        "max_price": None,
+        "in_stock": args.get("in_stock") in ("1", "true"),
+        "term": args.get("q", "").strip(),
+    }
+    for dimension in FACET_DIMENSIONS:
+        if len(filters[dimension]) > MAX_FILTER_VALUES:
+            raise ValueError(f"Too many {dimension} values")
+    for bound in ["min_price", "max_price"]:
+        if args.get(bound):
+            try:
+                filters[bound] = Decimal(args[bound])
+            except InvalidOperation:
+                raise ValueError(f"Invalid {bound}")
+    if "all-products" in filters["category"]:
+        filters["category"] = []
+    return filters
+
+
+def is_filtered(filters):
+    return any(
+        filters[name] not in (None, [], False, "")
+        for name in [*FACET_DIMENSIONS, "min_price", "max_price", "in_stock", "term"]
+    )
+
+
+def filter_products(products, filters):
+    """
+    Applies the facet filters to a current products query, values of the same
+    facet are alternatives and different facets all have to match.
+
+        Parameters:
+                products (Query): Current products query
+                filters (dict): Filters parsed by parse_facet_filters
+
+        Returns:
+                filtered_products (Query): Filtered products query
+    """
+    if filters["category"]:
+        products = products.filter(CurrentProduct.category.in_(filters["category"]))
+    if filters["subcategory"]:
+        products = products.filter(
+            CurrentProduct.subcategory_id.in_(filters["subcategory"])
+        )
+    if filters["brand"]:
+        products = products.filter(CurrentProduct.brand.in_(filters["brand"]))
+    if filters["min_price"] is not None:
+        products = products.filter(CurrentProduct.price >= filters["min_price"])
+    if filters["max_price"] is not None:
+        products = products.filter(CurrentProduct.price <= filters["max_price"])
+    if filters["in_stock"]:
+        products = products.filter(CurrentProduct.stock > 0)
+    if filters["term"]:
+        products = search_products(products, filters["term"])
+    return products
+
+
+def _category_label(category):
+    try:
+        return map_category(category)
+    except KeyError:
+        return category
+
+
+def _facet(dimension, value, label, product_count, in_stock_count):
+    return {
+        "dimension": dimension,
+        "value": value,
+        "label": label,
+        "product_count": product_count,
+        "in_stock_count": in_stock_count,
+    }
+
+
+def _count_all_dimensions(products):
+    """
+    Counts the products of every category, subcategory and brand in a single
+    GROUPING SETS statement.
+    """
+    grouped = (
+        products.order_by(None)
+        .with_entities(
+            CurrentProduct.category,
+            CurrentProduct.subcategory_id,
+            func.min(CurrentProduct.subcategory),
+            CurrentProduct.brand,
+            func.grouping(CurrentProduct.category),
+            func.grouping(CurrentProduct.subcategory_id),
+            func.count(),
+            func.count().filter(CurrentProduct.stock > 0),
+        )
+        .group_by(
+            func.grouping_sets(
+                tuple_(CurrentProduct.category),
+                tuple_(CurrentProduct.subcategory_id),
+                tuple_(CurrentProduct.brand),
+            )
+        )
+    )
+    facets = []
+    for (
+        category,
+        subcategory_id,
+        subcategory,
+        brand,
+        category_grouped,
+        subcategory_grouped,
+        product_count,
+        in_stock_count,
+    ) in grouped:
+        if not category_grouped:
+            dimension, value, label = "category", category, _category_label(category)
+        elif not subcategory_grouped:
+            dimension, value, label = "subcategory", str(subcategory_id), subcategory
+        else:
+            dimension, value, label = "brand", brand, brand
+        facets.append(_facet(dimension, value, label, product_count, in_stock_count))
+    return facets
+
+
+def _count_dimension(products, dimension):
+    """
+    Counts the products of every value of one facet dimension.
+    """
+    counts = [func.count(), func.count().filter(CurrentProduct.stock > 0)]
+    products = products.order_by(None)
+    if dimension == "subcategory":
+        grouped = products.with_entities(
+            CurrentProduct.subcategory_id, func.min(CurrentProduct.subcategory), *counts
+        ).group_by(CurrentProduct.subcategory_id)
+        return [
+            _facet(dimension, str(subcategory_id), subcategory, *totals)
+            for subcategory_id, subcategory, *totals in grouped
+        ]
+    column = getattr(CurrentProduct, dimension)
+    grouped = products.with_entities(column, *counts).group_by(column)
+    return [
+        _facet(
+            dimension,
+            value,
+            _category_label(value) if dimension == "category" else value,
+            *totals,
+        )
+        for value, *totals in grouped
+    ]
+
+
+def count_facets(filters):
+    """
+    Counts the products of every category, subcategory and brand. Each dimension
+    is counted over the products matching every filter but its own, so the other
+    values of a filtered facet keep the counts they would add. Without facet
+    filters the dimensions share one GROUPING SETS statement.
+
+        Parameters:
+                filters (dict): Filters parsed by parse_facet_filters
+
+        Returns:
+                facets (list): ProductFacet column dicts
+    """
+    if not any(filters[dimension] for dimension in FACET_DIMENSIONS):
+        return _count_all_dimensions(filter_products(CurrentProduct.query, filters))
+    facets = []
+    for dimension in FACET_DIMENSIONS:
+        products = filter_products(CurrentProduct.query, {**filters, dimension: []})
+        facets.extend(_count_dimension(products, dimension))
+    return facets
+
+
+def refresh_product_facets(db):
+    """
+    Replaces the precomputed facet counts with the counts of the current products.
+    Called by ingestion before the run is committed, so the counts are swapped
+    together with the current products.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+    """
+    db.session.execute(ProductFacet.__table__.delete())
+    facets = _count_all_dimensions(CurrentProduct.query)
+    if facets:
+        db.session.execute(ProductFacet.__table__.insert(), facets)
+
+
+def group_facets(facets):
+    """
+    Groups facet counts by dimension, most common values first.
+
+        Parameters:
+                facets (list): ProductFacet column dicts or mappings
+
+        Returns:
+                grouped_facets (dict): Maps dimension to its values
+    """
+    grouped_facets = {dimension: [] for dimension in FACET_DIMENSIONS}
+    for facet in facets:
+        grouped_facets[facet["dimension"]].append(
+            {
+                "value": facet["value"],
+                "label": facet["label"],
+                "count": facet["product_count"],
+                "in_stock": facet["in_stock_count"],
+            }
+        )
+    for values in grouped_facets.values():
+        values.sort(key=lambda value: (-value["count"], value["value"]))
+    return grouped_facets
+
+
+def query_faceted_products(db, filters, sort, page, per_page):
+    """
+    Queries a page of current products matching the facet filters with the
+    number of matches, in one statement, and the facet counts. Facet counts of
+    unfiltered requests are the ones precomputed at ingestion.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                filters (dict): Filters parsed by parse_facet_filters
+                sort (str): Sort type (total-highest, 14-days-highest, relevance...)
+                page (int): Page number
+                per_page (int): Products per page
+
+        Returns:
+                result (dict): Products, total and facets
+    """
+    products = filter_products(CurrentProduct.query, filters)
+    if sort == "relevance" and filters["term"]:
+        ordered = order_by_relevance(products, filters["term"])
+    else:
+        ordered = sort_products(products, sort)
+    columns = [
+        column for column in CurrentProduct.__table__.columns if column.key != "id"
+    ]
+    rows = (
+        ordered.with_entities(*columns, func.count().over().label("total"))
+        .offset((page - 1) * per_page)
+        .limit(per_page)
+        .all()
+    )
+    if rows:
+        total = rows[0].total
+    else:
+        total = products.order_by(None).count() if page > 1 else 0
+    if is_filtered(filters):
+        facets = count_facets(filters)
+    else:
+        facets = db.session.execute(ProductFacet.__table__.select()).mappings()
+    return {
+        "products": [
+            {column.key: getattr(row, column.key) for column in columns}
+            for row in rows
+        ],
+        "total": total,
+        "page": page,
+        "per_page": per_page,
+        "facets": group_facets(facets),
+    }
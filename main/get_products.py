@@ -1,11 +1,37 @@
-from main import db
-from main.models import Product
+from main import app, db
+from main.models import (
+    Product,
+    CurrentProduct,
+    ProductDetails,
+    ProductSnapshot,
+    ProductSummary,
+    Run,
+)
+from main.delta_storage import load_latest_snapshots
+from main.daily_sales import load_window_sold, write_daily_sales
+from main.facets import refresh_product_facets
+from main.history import ensure_products_partition
+from main.runs import calculate_next_run_number, start_run, finish_run, run_day
+from main.proxies import ProxyPool, as_requests_proxies
+from main.timeseries import append_run_to_histories
+from main.metrics import time_stage, ingestion_products
+from main.checkpoints import (
+    has_checkpoint,
+    write_checkpoint,
+    read_checkpoint,
+    clear_checkpoints,
+)
 import requests
 from urllib3.exceptions import InsecureRequestWarning
-import json
 import random
 import os
-from datetime import datetime, timedelta, date
+import time
+import ijson
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decimal import Decimal
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects import postgresql
 
 
 def request_proxy_list():
@@ -22,122 +48,567 @@ def request_proxy_list():
     return proxies
 
 
-def request_products_from_api(proxies=None):
+def load_proxy_pool(probe=True):
+    """
+    Creates the pool of proxies ingestion requests are made through, from the
+    static PROXY_LIST when it is configured (a comma separated list or a file
+    with one proxy per line) and from ProxyScrape otherwise.
+
+        Parameters:
+                probe (bool): Scores the proxies before returning the pool
+
+        Returns:
+                proxy_pool (ProxyPool): Pool of proxies
+    """
+    proxy_list = app.config["PROXY_LIST"]
+    if not proxy_list:
+        proxies = request_proxy_list()
+    elif os.path.isfile(proxy_list):
+        with open(proxy_list) as file:
+            proxies = [line.strip() for line in file if line.strip()]
+    else:
+        proxies = [proxy.strip() for proxy in proxy_list.split(",") if proxy.strip()]
+    proxy_pool = ProxyPool(proxies, app.config["PROXY_PROBE_URL"])
+    if probe:
+        proxy_pool.probe()
+    return proxy_pool
+
+
+ProductRecord = namedtuple(
+    "ProductRecord",
+    [
+        "product_id",
+        "product_name",
+        "brand",
+        "category",
+        "subcategory",
+        "subcategory_id",
+        "price",
+        "stock",
+        "image",
+    ],
+)
+
+MAX_BACKOFF = 120  # Upper bound of the delay between category attempts, in seconds
+
+CATEGORIES = [
+    "outdoor-wireless",
+    "home-office-networks",
+    "lte-products",
+    "fiber-networks",
+    "security-systems",
+    "iot-products",
+    "fleet-management",
+    "cables-and-cabinets",
+    "electrical-equipment",
+    "mounts-and-brackets",
+    "gadgets",
+]
+
+
+def create_session(pool_size=len(CATEGORIES), verify=False):
+    """
+    Creates a requests session with a keep-alive connection pool
+    shared by all category requests.
+
+        Parameters:
+                pool_size (int): Maximum number of pooled connections
+                verify (bool): Verifies the TLS certificates of the servers
+
+        Returns:
+                session (requests.Session): Session with the mounted connection pool
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.verify = verify
+    return session
+
+
+def build_product_record(product, category, subcategory, subcategory_id):
+    """
+    Extracts the tracked fields from a single product of Getic's API response.
+
+        Parameters:
+                product (dict): Product object from the API response
+                category (str): Getic's category slug
+                subcategory (str): Title of the product's subcategory
+                subcategory_id (int): ID of the product's subcategory
+
+        Returns:
+                record (ProductRecord): Contains product related data (Name, price, stock...)
+    """
+    stock = 0
+    for element in product["amounts"]:
+        if element["conditionId"] == "000000001":
+            stock = element["amount"]
+            break
+    return ProductRecord(
+        product_id=str(product["id"]),
+        product_name=product["title"],
+        brand=product["brand"],
+        category=category,
+        subcategory=subcategory,
+        subcategory_id=subcategory_id,
+        price=str(product["prices"][0]["prices"][0]["price"]),
+        stock=stock,
+        image=f'https://www.getic.com{product["images"][0]["variants"][0]["path"]}',
+    )
+
+
+def parse_category_products(stream, category):
+    """
+    Incrementally parses a category response, walking content[].products[]
+    without decoding the whole document into memory.
+
+        Parameters:
+                stream (file-like object): Raw response body
+                category (str): Getic's category slug
+
+        Yields:
+                record (ProductRecord): Contains product related data (Name, price, stock...)
+    """
+    product_prefix = "content.item.products.item"
+    subcategory = subcategory_id = None
+    pending = []  # Products seen before their subcategory title and id
+    builder = None
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == product_prefix and event == "end_map":
+                if subcategory is None or subcategory_id is None:
+                    pending.append(builder.value)
+                else:
+                    yield build_product_record(
+                        builder.value, category, subcategory, subcategory_id
+                    )
+                builder = None
+        elif prefix == product_prefix and event == "start_map":
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+        elif prefix == "content.item" and event == "start_map":
+            subcategory = subcategory_id = None
+        elif prefix == "content.item.title":
+            subcategory = value
+        elif prefix == "content.item.id":
+            subcategory_id = value
+        elif prefix == "content.item" and event == "end_map":
+            for product in pending:
+                yield build_product_record(
+                    product, category, subcategory, subcategory_id
+                )
+            pending = []
+
+
+def request_category_products(session, category, proxy=None, timeout=60):
+    """
+    Makes a streaming call to Getic's API for a single product category.
+
+        Parameters:
+                session (requests.Session): Session used to make the request
+                category (str): Getic's category slug
+                proxy (dict): HTTPS proxy, if the request should go through one
+                timeout (int): Request timeout in seconds
+
+        Yields:
+                record (ProductRecord): Contains product related data (Name, price, stock...)
+    """
+    url = f"https://www.getic.com/api/preset-subcategory/{category}?limit=10000&inStock=0&variationId=cfbb89b0-7217-11eb-ed9f-fa163e4a2e20"
+    start_time = time.perf_counter()
+    with session.get(url, proxies=proxy, timeout=timeout, stream=True) as r:
+        r.raise_for_status()
+        r.raw.decode_content = True
+        product_count = 0
+        for record in parse_category_products(r.raw, category):
+            product_count += 1
+            yield record
+    print(
+        f"Fetched {category}: {product_count} products in {time.perf_counter() - start_time:.2f}s"
+    )
+
+
+class CategoryRequestError(Exception):
+    """
+    Raised when categories could not be fetched within the maximum number of attempts.
+    """
+
+
+def _is_retryable(error):
+    """
+    Checks whether a failed category request is worth another attempt.
+    Client errors other than timeouts and rate limiting are not.
+    """
+    response = getattr(error, "response", None)
+    if isinstance(error, requests.HTTPError) and response is not None:
+        return response.status_code in (408, 429) or response.status_code >= 500
+    return True
+
+
+def fetch_category(
+    session, category, proxy_pool=None, timeout=60, max_attempts=5, backoff=2
+):
+    """
+    Downloads a category into its checkpoint, unless an earlier ingestion
+    attempt today already did. Failed attempts are retried with exponential
+    backoff and full jitter. With a proxy pool, each attempt goes through the
+    proxy the pool picks and its outcome is reported back to the pool.
+
+        Parameters:
+                session (requests.Session): Session used to make the requests
+                category (str): Getic's category slug
+                proxy_pool (ProxyPool): Proxies to rotate over, direct connection if None
+                timeout (int): Per-request timeout in seconds
+                max_attempts (int): Maximum number of attempts
+                backoff (float): Base delay between attempts in seconds
+
+        Returns:
+                product_count (int): Number of products fetched, None if resumed
+    """
+    if has_checkpoint(category):
+        print(f"Resuming {category} from its checkpoint")
+        return None
+    for attempt in range(1, max_attempts + 1):
+        proxy = None
+        if proxy_pool is not None:
+            proxy = proxy_pool.acquire()
+        try:
+            with time_stage("fetch", category):
+                product_count = write_checkpoint(
+                    category,
+                    request_category_products(
+                        session, category, as_requests_proxies(proxy), timeout
+                    ),
+                )
+        except Exception as error:
+            if proxy is not None:
+                proxy_pool.report(proxy, False)
+            if attempt == max_attempts or not _is_retryable(error):
+                raise
+            delay = random.uniform(0, min(MAX_BACKOFF, backoff * 2 ** (attempt - 1)))
+            print(
+                f"Error, unable to request {category} "
+                f"(attempt {attempt}/{max_attempts}): {error}, retrying in {delay:.1f}s"
+            )
+            time.sleep(delay)
+        else:
+            if proxy is not None:
+                proxy_pool.report(proxy, True)
+            ingestion_products.set(category, value=product_count)
+            return product_count
+
+
+def iter_products_from_api(
+    proxy_pool=None, max_workers=4, timeout=60, max_attempts=None
+):
+    """
+    Makes a call to Getic's API for each product category and yields products
+    category by category. Categories are requested concurrently over a shared
+    connection pool and checkpointed to disk as they complete, so memory stays
+    flat regardless of the catalogue size and a failed ingestion resumes from
+    the categories already fetched instead of downloading everything again.
+    If a proxy pool is provided in the function call, requests will be rotated over it.
+
+        Parameters:
+                proxy_pool (ProxyPool): Proxies to make the requests through
+                max_workers (int): Maximum number of concurrent category requests
+                timeout (int): Per-request timeout in seconds
+                max_attempts (int): Attempts per category (INGEST_MAX_ATTEMPTS)
+
+        Yields:
+                record (ProductRecord): Contains product related data (Name, price, stock...)
+
+        Raises:
+                CategoryRequestError: Once the other categories are yielded, if
+                        any category failed all its attempts
+    """
+    requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
+    if max_attempts is None:
+        max_attempts = app.config["INGEST_MAX_ATTEMPTS"]
+    clear_checkpoints(keep_today=True)  # Left behind by ingestions on earlier days
+    start_time = time.perf_counter()
+    failed_categories = []
+    with create_session(max_workers) as session:
+        if proxy_pool is not None:
+            session.hooks["response"].append(proxy_pool.observe_response)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    fetch_category,
+                    session,
+                    category,
+                    proxy_pool,
+                    timeout,
+                    max_attempts,
+                ): category
+                for category in CATEGORIES
+            }
+            for future in as_completed(futures):
+                category = futures[future]
+                try:
+                    future.result()
+                except Exception as error:
+                    print(f"Error, unable to request {category}: {error}")
+                    failed_categories.append(category)
+                    continue
+                for row in read_checkpoint(category):
+                    yield ProductRecord(*row)
+    if failed_categories:
+        raise CategoryRequestError(
+            f"Unable to request {', '.join(failed_categories)}, "
+            "the other categories are checkpointed"
+        )
+    print(
+        f"Fetched {len(CATEGORIES)} categories in {time.perf_counter() - start_time:.2f}s"
+    )
+
+
+def request_products_from_api(proxies=None, max_workers=4, timeout=60):
     """
     Makes a call to Getic's API for each product category to get the product data.
     If proxies are provided in the function call, requests will be made through them.
 
         Parameters:
                 proxies (list): Contains HTTPS proxies
+                max_workers (int): Maximum number of concurrent category requests
+                timeout (int): Per-request timeout in seconds
 
         Returns:
                 products (list): Contains data about each product
     """
-    
-    categories = [
-        "outdoor-wireless",
-        "home-office-networks",
-        "lte-products",
-        "fiber-networks",
-        "security-systems",
-        "iot-products",
-        "fleet-management",
-        "cables-and-cabinets",
-        "electrical-equipment",
-        "mounts-and-brackets",
-        "gadgets",
-    ]
-     
-    products = []
-    while True:
-        try:
-            if proxies is not None:
-                proxy_index = random.randint(0, len(proxies) - 1)
-                proxy = {"https": proxies[proxy_index]}
-                print(proxy)
-            for category in categories:
-                url = f"https://www.getic.com/api/preset-subcategory/{category}?limit=10000&inStock=0&variationId=cfbb89b0-7217-11eb-ed9f-fa163e4a2e20"
-                requests.packages.urllib3.disable_warnings(
-                    category=InsecureRequestWarning
-                )
-                if proxies is not None:
-                    r = requests.get(url, proxies=proxy, verify=False)
-                else:
-                    r = requests.get(url, verify=False)
-                parsed_response = json.loads(r.text)
-                for product_group in parsed_response["content"]:
-                    subcategory = product_group["title"]
-                    subcategory_id = product_group["id"]
-                    for product in product_group["products"]:
-                        product_name = product["title"]
-                        brand = product["brand"]
-                        price = str(product["prices"][0]["prices"][0]["price"])
-                        amounts = product["amounts"]
-                        stock = 0
-                        for element in amounts:
-                            if element["conditionId"] == "000000001":
-                                stock = element["amount"]
-                                break
-                        image = f'https://www.getic.com{product["images"][0]["variants"][0]["path"]}'
-                        product_id = str(product["id"])
-                        products.append(
-                            [
-                                product_id,
-                                product_name,
-                                brand,
-                                category,
-                                subcategory,
-                                subcategory_id,
-                                price,
-                                stock,
-                                image,
-                            ]
-                        )
-            break
-        except:
-            print("Error, unable to request the data.")
-    return products
+    proxy_pool = None
+    if proxies is not None:
+        proxy_pool = ProxyPool(proxies, app.config["PROXY_PROBE_URL"])
+        proxy_pool.probe()
+    return list(iter_products_from_api(proxy_pool, max_workers, timeout))
 
 
-def write_products_to_db(db, products):
+def write_products_to_db(db, products, batch_size=1000):
     """
     Writes data related to each product into a database table.
+    Reference snapshots are loaded once for all products, sold counters are
+    calculated in memory and rows are bulk inserted in batches of batch_size.
+    In the "delta" storage mode only changed prices and stocks are recorded.
+    The run is also appended to the per-product history arrays and the facet
+    counts are recomputed. All of it is one transaction, committed by finish_run
+    together with the run, so a failed run leaves no rows behind. Only the
+    empty partition the run is written to is created and committed beforehand.
 
     Parameters:
             db (SQLAlchemy object): Database instance
-            product (list): Contains product related data (Name, price, stock...)
+            products (iterable): Contains product related data (Name, price, stock...)
+            batch_size (int): Number of products inserted into the database at once
+    """
+    run = start_run(db)
+    run_number = run.run_number  # Current DB writing iteration
+    day = run_day(run.time_started)  # Day the run's sales are recorded on
+    try:
+        with time_stage("write"):
+            if app.config["STORAGE_MODE"] == "delta":
+                product_count = _write_run_deltas(
+                    db, products, run_number, day, batch_size
+                )
+            else:
+                ensure_products_partition(db, run_number)  # Commits the DDL only
+                product_count = _write_run_products(
+                    db, products, run_number, day, batch_size
+                )
+                refresh_current_products(db, run_number)
+            refresh_product_facets(db)
+            append_run_to_histories(db, run_number)
+    except Exception:
+        db.session.rollback()
+        finish_run(db, run, 0, status="failed")
+        raise
+    finish_run(db, run, product_count)  # Commits the swap together with the run
+
+
+def _write_run_products(db, products, run_number, day, batch_size):
     """
-    run_number = calculate_current_run_number(db)  # Current DB writing iteration
-    previous_product_ids = []
+    Bulk inserts the products of a run and its daily sales, without committing,
+    and returns the number of products written.
+    """
+    seven_days_sold = load_window_sold(db, 7, day)
+    thirty_days_sold = load_window_sold(db, 30, day)
+    written_product_ids = set()
+    product_rows, sales_rows = [], []
+    for product, latest_entry in _pair_latest_entries(db, products, batch_size):
+        product_id = int(product[0])
+        if product_id in written_product_ids:
+            continue
+        sold, sold_all_time, sold_thirty_days, sold_seven_days = (
+            calculate_product_sold(
+                int(product[7]),
+                latest_entry,
+                thirty_days_sold.get(product_id, 0),
+                seven_days_sold.get(product_id, 0),
+            )
+        )
+        if sold:
+            sales_rows.append({"product_id": product_id, "day": day, "sold": sold})
+        product_rows.append(
+            {
+                "product_id": product_id,
+                "product_name": product[1],
+                "brand": product[2],
+                "category": product[3],
+                "subcategory": product[4],
+                "subcategory_id": product[5],
+                "price": product[6],
+                "stock": product[7],
+                "sold_all_time": sold_all_time,
+                "sold_thirty_days": sold_thirty_days,
+                "sold_seven_days": sold_seven_days,
+                "image": product[8],
+                "run_number": run_number,
+            }
+        )
+        written_product_ids.add(product_id)
+        if len(product_rows) >= batch_size:
+            db.session.execute(Product.__table__.insert(), product_rows)
+            write_daily_sales(db, sales_rows)
+            product_rows, sales_rows = [], []
+    if product_rows:
+        db.session.execute(Product.__table__.insert(), product_rows)
+    write_daily_sales(db, sales_rows)
+    return len(written_product_ids)
+
+
+def _write_run_deltas(db, products, run_number, day, batch_size):
+    """
+    Records the products of a run in the delta tables and the current products
+    snapshot, without committing, and returns the number of products written.
+    """
+    latest_snapshots = load_latest_snapshots(db)
+    seven_days_sold = load_window_sold(db, 7, day)
+    thirty_days_sold = load_window_sold(db, 30, day)
+    details_columns = [column.name for column in ProductDetails.__table__.columns]
+    details_columns.remove("time_updated")
+    details_insert = postgresql.insert(ProductDetails.__table__)
+    details_upsert = details_insert.on_conflict_do_update(
+        index_elements=["product_id"],
+        set_={
+            **{column: details_insert.excluded[column] for column in details_columns},
+            "time_updated": func.now(),
+        },
+        where=tuple_(
+            *(ProductDetails.__table__.c[column] for column in details_columns)
+        ).is_distinct_from(
+            tuple_(*(details_insert.excluded[column] for column in details_columns))
+        ),
+    )
+    db.session.execute(CurrentProduct.__table__.delete())
+    written_product_ids = set()
+    details_rows, snapshot_rows, current_rows, sales_rows = [], [], [], []
+
+    def write_batch():
+        if details_rows:
+            db.session.execute(details_upsert, details_rows)
+        if snapshot_rows:
+            db.session.execute(ProductSnapshot.__table__.insert(), snapshot_rows)
+        if current_rows:
+            db.session.execute(CurrentProduct.__table__.insert(), current_rows)
+        write_daily_sales(db, sales_rows)
+        del details_rows[:], snapshot_rows[:], current_rows[:], sales_rows[:]
+
     for product in products:
-        if product[0] not in previous_product_ids:
-            sold_all_time = calculate_product_all_time_sold(
-                db, product
-            )  # Times product has been sold
-            sold_seven_days = calculate_product_timeperiod_sold(
-                db, product, sold_all_time, 6
-            )  # Times product has been sold in 7 days
-            sold_thirty_days = calculate_product_timeperiod_sold(
-                db, product, sold_all_time, 29
-            )  # Times product has been sold in 30 days
-            product_row = Product(
-                product_id=product[0],
-                product_name=product[1],
-                brand=product[2],
-                category=product[3],
-                subcategory=product[4],
-                subcategory_id=product[5],
-                price=product[6],
-                stock=product[7],
-                sold_all_time=sold_all_time,
-                sold_thirty_days=sold_thirty_days,
-                sold_seven_days=sold_seven_days,
-                image=product[8],
-                run_number=run_number,
+        product_id = int(product[0])
+        if product_id in written_product_ids:
+            continue
+        stock = int(product[7])
+        price = Decimal(product[6])
+        latest_snapshot = latest_snapshots.get(product_id)
+        sold, sold_all_time, sold_thirty_days, sold_seven_days = (
+            calculate_product_sold(
+                stock,
+                latest_snapshot,
+                thirty_days_sold.get(product_id, 0),
+                seven_days_sold.get(product_id, 0),
+            )
+        )
+        if sold:
+            sales_rows.append({"product_id": product_id, "day": day, "sold": sold})
+        details = {
+            "product_id": product_id,
+            "product_name": product[1],
+            "brand": product[2],
+            "category": product[3],
+            "subcategory": product[4],
+            "subcategory_id": product[5],
+            "image": product[8],
+        }
+        details_rows.append(details)
+        if (
+            latest_snapshot is None
+            or latest_snapshot.removed
+            or latest_snapshot.stock != stock
+            or latest_snapshot.price != price
+        ):
+            snapshot_rows.append(
+                {
+                    "product_id": product_id,
+                    "run_number": run_number,
+                    "price": price,
+                    "stock": stock,
+                    "sold_all_time": sold_all_time,
+                    "removed": False,
+                }
+            )
+        current_rows.append(
+            {
+                **details,
+                "id": product_id,
+                "price": price,
+                "stock": stock,
+                "sold_all_time": sold_all_time,
+                "sold_thirty_days": sold_thirty_days,
+                "sold_seven_days": sold_seven_days,
+                "run_number": run_number,
+            }
+        )
+        written_product_ids.add(product_id)
+        if len(current_rows) >= batch_size:
+            write_batch()
+    for product_id, latest_snapshot in latest_snapshots.items():
+        if product_id not in written_product_ids and not latest_snapshot.removed:
+            snapshot_rows.append(
+                {
+                    "product_id": product_id,
+                    "run_number": run_number,
+                    "price": latest_snapshot.price,
+                    "stock": latest_snapshot.stock,
+                    "sold_all_time": latest_snapshot.sold_all_time,
+                    "removed": True,
+                }
             )
-            previous_product_ids.append(product[0])
-            db.session.add(product_row)
-    db.session.commit()
+            if len(snapshot_rows) >= batch_size:
+                write_batch()
+    write_batch()
+    return len(written_product_ids)
+
+
+def refresh_current_products(db, run_number):
+    """
+    Replaces the current products snapshot with the products of the specified run.
+    The swap is committed by the caller, so readers see either the old or
+    the new snapshot.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                run_number (int): Writing iteration that becomes the current snapshot
+    """
+    columns = [column.name for column in CurrentProduct.__table__.columns]
+    db.session.execute(CurrentProduct.__table__.delete())
+    db.session.execute(
+        CurrentProduct.__table__.insert().from_select(
+            columns,
+            select(*(Product.__table__.c[column] for column in columns)).where(
+                Product.run_number == run_number
+            ),
+        )
+    )
 
 
 def calculate_current_run_number(db):
@@ -150,78 +621,119 @@ def calculate_current_run_number(db):
         Returns:
                 current_run_number (int): Current writing iteration
     """
-    all_products = Product.query.all()
-    if all_products:
-        run_numbers = []
-        for product in all_products:
-            run_numbers.append(product.run_number)
-        current_run_number = max(run_numbers) + 1
-        return current_run_number
-    return 1  # If there are no products in the database, returns 1
+    return calculate_next_run_number(db)
 
 
-def calculate_product_all_time_sold(db, product):
+def load_latest_product_entries(db):
     """
-    Calculates how many times the product has been sold.
+    Loads the entry of every product in the last completed run from the current
+    products snapshot, one row per product, so the cost does not grow with the
+    stored history.
 
         Parameters:
                 db (SQLAlchemy object): Database instance
-                product (list): Contains product related data (Name, price, stock...)
 
         Returns:
-                sold_all_time (int): Number of times the product has been sold
-    """
-    product_entries_db = Product.query.filter(Product.product_id == product[0]).all()
-    if product_entries_db:
-        last_product_entry = product_entries_db[-1]
-        if last_product_entry.stock <= int(product[7]):
-            return last_product_entry.sold_all_time
-        sold_all_time = last_product_entry.sold_all_time + (
-            last_product_entry.stock - int(product[7])
-        )
-        return sold_all_time
-    return 0  # If no product entry in the database, return 0
+                latest_entries (dict): Maps product ID to its latest (stock, sold_all_time) entry
+    """
+    entries = db.session.query(
+        CurrentProduct.product_id, CurrentProduct.stock, CurrentProduct.sold_all_time
+    )
+    return {entry.product_id: entry for entry in entries}
 
 
-def calculate_product_timeperiod_sold(db, product, sold_by_current_date, days):
+def load_product_entries(db, product_ids):
     """
-    Calculates how many times the product has been sold in the specified time period.
+    Loads the most recent database entry of products missing from the current
+    snapshot (new products, or products back in the catalogue), through the
+    (product_id, run_number) index and from completed runs only, then from the
+    summaries of the products last seen before the compacted history horizon.
 
         Parameters:
                 db (SQLAlchemy object): Database instance
-                product (list): Contains product related data (Name, price, stock...)
-                days (int): Specified time period in days
+                product_ids (list): Product IDs
 
         Returns:
-                sold_in_days (int): Number of times the product has been sold
+                latest_entries (dict): Maps product ID to its latest (stock, sold_all_time) entry
     """
-    product_entries_db = Product.query.filter(Product.product_id == product[0]).all()
-    if product_entries_db:
-        start_date = date.today() - timedelta(days)
-        sold_in_days = 0
-        for element in product_entries_db:
-            if element.time_created.date() == start_date:
-                start_date_sold = element.sold_all_time
-                sold_in_days = sold_by_current_date - start_date_sold
-                return sold_in_days
-    return 0
+    if not product_ids:
+        return {}
+    # Rows of runs that did not complete are not a reference, history written
+    # before the runs table existed has no run and is kept
+    unfinished_runs = select(Run.run_number).where(Run.status != "completed")
+    entries = (
+        db.session.query(Product.product_id, Product.stock, Product.sold_all_time)
+        .filter(Product.product_id.in_(product_ids))
+        .filter(Product.run_number.not_in(unfinished_runs))
+        .order_by(Product.product_id, Product.run_number.desc())
+        .distinct(Product.product_id)
+    )
+    latest_entries = {entry.product_id: entry for entry in entries}
+    missing_ids = [
+        product_id for product_id in product_ids if product_id not in latest_entries
+    ]
+    if missing_ids:
+        summaries = (
+            db.session.query(
+                ProductSummary.product_id,
+                ProductSummary.last_stock.label("stock"),
+                ProductSummary.last_sold_all_time.label("sold_all_time"),
+            )
+            .filter(ProductSummary.product_id.in_(missing_ids))
+            .order_by(ProductSummary.product_id, ProductSummary.last_run_number.desc())
+            .distinct(ProductSummary.product_id)
+        )
+        latest_entries.update((summary.product_id, summary) for summary in summaries)
+    return latest_entries
 
 
-def get_product_images(db):
+def _pair_latest_entries(db, products, batch_size):
     """
-    Downloads images of all products stored in the database.
-
-    Parameters:
-            db (SQLAlchemy object): Database instance
+    Pairs each product with its latest entry. Products missing from the current
+    snapshot are looked up in batches, so their order in the run may change.
     """
-    products = Product.query.distinct(Product.product_id).all()
-    print("Downloading images...")
+    latest_entries = load_latest_product_entries(db)
+    pending = []
+
+    def resolve():
+        product_ids = list({int(product[0]) for product in pending})
+        entries = load_product_entries(db, product_ids)
+        for product in pending:
+            yield product, entries.get(int(product[0]))
+        pending.clear()
+
     for product in products:
-        print(product.image)
-        r = requests.get(product.image).content
-        with open(
-            os.path.join("main/static/img/", f"{product.product_id}.jpg"), "wb+"
-        ) as file:
-            file.write(r)
-            file.close()
-    print("Images downloaded...")
+        latest_entry = latest_entries.get(int(product[0]))
+        if latest_entry is not None:
+            yield product, latest_entry
+            continue
+        pending.append(product)
+        if len(pending) >= batch_size:
+            yield from resolve()
+    yield from resolve()
+
+
+def calculate_product_sold(stock, latest_entry, thirty_days_sold, seven_days_sold):
+    """
+    Calculates how many times the product has been sold since the previous run,
+    all time and in the last thirty and seven days.
+
+        Parameters:
+                stock (int): Current stock of the product
+                latest_entry (Row): Latest (stock, sold_all_time) entry of the product, if any
+                thirty_days_sold (int): Units sold in the thirty days before this run
+                seven_days_sold (int): Units sold in the seven days before this run
+
+        Returns:
+                sold (tuple): Times sold since the previous run, all time,
+                        in thirty days and in seven days
+    """
+    if latest_entry is None:
+        return 0, 0, 0, 0  # If no product entry in the database, nothing was sold
+    sold = max(latest_entry.stock - stock, 0)
+    return (
+        sold,
+        latest_entry.sold_all_time + sold,
+        thirty_days_sold + sold,
+        seven_days_sold + sold,
+    )
@@ -0,0 +1,280 @@
+from main.models import Product, ProductSummary, Run
+from sqlalchemy import case, func, literal, select, text
+from sqlalchemy.dialects import postgresql
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+import re
+
+RUNS_PER_PARTITION = 30  # Roughly a month of daily runs
+# Rebuilding the daily sales ledger reads raw snapshots, the 30-day windows need
+# their days and the snapshot before them to stay correct after a rebuild
+MIN_HORIZON_DAYS = 31
+
+Partition = namedtuple("Partition", ["name", "start", "end", "rows", "size"])
+CompactionReport = namedtuple(
+    "CompactionReport",
+    ["cutoff_run", "first_run", "last_run", "partitions", "rows", "size"],
+)
+
+
+def is_partitioned(db):
+    """
+    Checks whether the products table is range partitioned by run number.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+
+        Returns:
+                partitioned (bool): True if products is a partitioned PostgreSQL table
+    """
+    if db.engine.dialect.name != "postgresql":
+        return False
+    return db.session.execute(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = 'products'::regclass)"
+        )
+    ).scalar()
+
+
+def partition_bounds(run_number):
+    """
+    Calculates the run number range of the partition holding the specified run.
+
+        Parameters:
+                run_number (int): Writing iteration
+
+        Returns:
+                bounds (tuple): First run number of the partition and the exclusive upper bound
+    """
+    start = (run_number - 1) // RUNS_PER_PARTITION * RUNS_PER_PARTITION + 1
+    return start, start + RUNS_PER_PARTITION
+
+
+def partition_name(start):
+    """
+    Names the partition starting at the specified run number.
+    """
+    return f"products_runs_{start:06d}"
+
+
+def ensure_products_partition(db, run_number):
+    """
+    Creates the partition the specified run will be written to, if it does not exist.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                run_number (int): Writing iteration
+    """
+    if not is_partitioned(db):
+        return
+    start, end = partition_bounds(run_number)
+    db.session.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(start)} "
+            f"PARTITION OF products FOR VALUES FROM ({start}) TO ({end})"
+        )
+    )
+    db.session.commit()
+
+
+def list_products_partitions(db):
+    """
+    Lists the run number range partitions of the products table.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+
+        Returns:
+                partitions (list): Partition tuples (name, start, end, rows, size in bytes)
+    """
+    children = db.session.execute(
+        text(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid),
+                   pg_total_relation_size(child.oid)
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = 'products'
+            """
+        )
+    )
+    partitions = []
+    for name, bound, size in children:
+        match = re.search(r"FROM \((\d+)\) TO \((\d+)\)", bound)
+        if match is None:
+            continue  # Default partition
+        rows = db.session.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+        partitions.append(
+            Partition(name, int(match.group(1)), int(match.group(2)), rows, size)
+        )
+    return sorted(partitions, key=lambda partition: partition.start)
+
+
+def summarize_runs(db, first_run, last_run, period):
+    """
+    Rolls the snapshots of a run range up into weekly or monthly product summaries.
+    Periods already partly summarized by an earlier compaction are merged.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                first_run (int): First run to summarize
+                last_run (int): Last run to summarize
+                period (str): Summary period ("week" or "month")
+    """
+    period_start = func.date_trunc(period, Product.time_created).cast(
+        ProductSummary.period_start.type
+    )
+    snapshots = (
+        select(
+            Product.product_id,
+            literal(period),
+            period_start,
+            func.max(Product.product_name),
+            func.max(Product.brand),
+            func.max(Product.category),
+            func.count(),
+            func.min(Product.run_number),
+            func.max(Product.run_number),
+            func.min(Product.price),
+            func.max(Product.price),
+            func.sum(Product.price),
+            func.min(Product.stock),
+            func.max(Product.stock),
+            postgresql.array_agg(
+                postgresql.aggregate_order_by(Product.stock, Product.run_number.desc())
+            )[1],
+            func.min(Product.sold_all_time),
+            func.max(Product.sold_all_time),
+        )
+        .where(Product.run_number.between(first_run, last_run))
+        .group_by(Product.product_id, period_start)
+    )
+    insert = postgresql.insert(ProductSummary.__table__).from_select(
+        [column.name for column in ProductSummary.__table__.columns], snapshots
+    )
+    summaries = ProductSummary.__table__.c
+    excluded = insert.excluded
+    db.session.execute(
+        insert.on_conflict_do_update(
+            index_elements=["product_id", "period", "period_start"],
+            set_={
+                "product_name": excluded.product_name,
+                "brand": excluded.brand,
+                "category": excluded.category,
+                "run_count": summaries.run_count + excluded.run_count,
+                "first_run_number": func.least(
+                    summaries.first_run_number, excluded.first_run_number
+                ),
+                "last_run_number": func.greatest(
+                    summaries.last_run_number, excluded.last_run_number
+                ),
+                "min_price": func.least(summaries.min_price, excluded.min_price),
+                "max_price": func.greatest(summaries.max_price, excluded.max_price),
+                "total_price": summaries.total_price + excluded.total_price,
+                "min_stock": func.least(summaries.min_stock, excluded.min_stock),
+                "max_stock": func.greatest(summaries.max_stock, excluded.max_stock),
+                "last_stock": case(
+                    (
+                        excluded.last_run_number > summaries.last_run_number,
+                        excluded.last_stock,
+                    ),
+                    else_=summaries.last_stock,
+                ),
+                "first_sold_all_time": func.least(
+                    summaries.first_sold_all_time, excluded.first_sold_all_time
+                ),
+                "last_sold_all_time": func.greatest(
+                    summaries.last_sold_all_time, excluded.last_sold_all_time
+                ),
+            },
+        )
+    )
+
+
+def compact_history(db, horizon_days, period="month", dry_run=False, drop=False):
+    """
+    Rolls product snapshots older than the horizon up into summaries and removes
+    the raw rows. Partitions entirely older than the horizon are detached and
+    kept as archive tables, or dropped. Without partitioning the rows are deleted.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                horizon_days (int): Age in days after which snapshots are compacted
+                period (str): Summary period ("week" or "month")
+                dry_run (bool): Only reports what would be compacted
+                drop (bool): Drops detached partitions instead of archiving them
+
+        Returns:
+                report (CompactionReport): Compacted runs, partitions, rows and bytes reclaimed
+    """
+    horizon_days = max(horizon_days, MIN_HORIZON_DAYS)
+    cutoff_time = datetime.now(timezone.utc) - timedelta(horizon_days)
+    cutoff_run = (
+        db.session.query(func.max(Run.run_number))
+        .filter(Run.time_started < cutoff_time)
+        .scalar()
+    )
+    partitioned = is_partitioned(db)
+    if cutoff_run is None:
+        report = CompactionReport(None, None, None, [], 0, 0)
+    elif partitioned:
+        partitions = [
+            partition
+            for partition in list_products_partitions(db)
+            if partition.end - 1 <= cutoff_run and partition.rows
+        ]
+        report = CompactionReport(
+            cutoff_run,
+            min((partition.start for partition in partitions), default=None),
+            max((partition.end - 1 for partition in partitions), default=None),
+            [partition.name for partition in partitions],
+            sum(partition.rows for partition in partitions),
+            sum(partition.size for partition in partitions),
+        )
+    else:
+        rows, first_run = (
+            db.session.query(func.count(Product.id), func.min(Product.run_number))
+            .filter(Product.run_number <= cutoff_run)
+            .one()
+        )
+        total_rows = db.session.query(func.count(Product.id)).scalar()
+        table_size = db.session.execute(
+            text("SELECT pg_total_relation_size('products')")
+        ).scalar()
+        report = CompactionReport(
+            cutoff_run,
+            first_run,
+            cutoff_run if rows else None,
+            [],
+            rows,
+            table_size * rows // total_rows if total_rows else 0,  # Estimate
+        )
+
+    action = "Would compact" if dry_run else "Compacting"
+    print(
+        f"{action} runs {report.first_run}-{report.last_run} "
+        f"({report.rows} rows, {len(report.partitions)} partitions, "
+        f"{report.size / 1024 / 1024:.1f} MB reclaimed)"
+    )
+    if dry_run or not report.rows:
+        return report
+
+    summarize_runs(db, report.first_run, report.last_run, period)
+    if partitioned:
+        for name in report.partitions:
+            db.session.execute(text(f"ALTER TABLE products DETACH PARTITION {name}"))
+            if drop:
+                db.session.execute(text(f"DROP TABLE {name}"))
+            else:
+                db.session.execute(
+                    text(f"ALTER TABLE {name} RENAME TO archived_{name}")
+                )
+    else:
+        db.session.query(Product).filter(
+            Product.run_number <= report.last_run
+        ).delete(synchronize_session=False)
+    db.session.commit()
+    print("History compacted...")
+    return report
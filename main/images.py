@@ -0,0 +1,183 @@
+from main.models import CurrentProduct, ProductImage
+from main.get_products import create_session
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from PIL import Image
+import hashlib
+import io
+import os
+import shutil
+import threading
+import time
+
+IMAGE_DIR = os.path.join(os.path.dirname(__file__), "static", "img")
+THUMBNAIL_DIR = os.path.join(IMAGE_DIR, "thumbs")
+OBJECT_DIR = "objects"  # Content addressed files, shared by identical images
+THUMBNAIL_SIZE = (300, 300)  # Fits the product cards on the dashboard
+
+
+def _write_file(path, content):
+    """
+    Writes a file atomically, so readers never see a partially written image.
+    """
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(content)
+    os.replace(temporary_path, path)
+
+
+def _link_file(source, destination):
+    """
+    Points destination at the content of source, with a hard link where possible.
+    """
+    temporary_path = (
+        f"{destination}.{os.getpid()}.{threading.get_ident()}.tmp"
+    )
+    try:
+        os.link(source, temporary_path)
+    except OSError:
+        shutil.copyfile(source, temporary_path)
+    os.replace(temporary_path, destination)
+
+
+def create_thumbnail(content):
+    """
+    Scales an image down to the size of a product card.
+
+        Parameters:
+                content (bytes): Full size image
+
+        Returns:
+                thumbnail (bytes): JPEG thumbnail
+    """
+    with Image.open(io.BytesIO(content)) as image:
+        image = image.convert("RGB")
+        image.thumbnail(THUMBNAIL_SIZE)
+        thumbnail = io.BytesIO()
+        image.save(thumbnail, "JPEG", quality=80, optimize=True)
+    return thumbnail.getvalue()
+
+
+def store_product_image(product_id, content_hash, content=None):
+    """
+    Stores an image and its thumbnail once per distinct content and links them
+    to the product's paths (img/<product_id>.jpg and img/thumbs/<product_id>.jpg).
+
+        Parameters:
+                product_id (int): Getic's product ID
+                content_hash (str): SHA-256 of the image
+                content (bytes): Image, if it was downloaded
+    """
+    image_path = os.path.join(IMAGE_DIR, OBJECT_DIR, f"{content_hash}.jpg")
+    thumbnail_path = os.path.join(THUMBNAIL_DIR, OBJECT_DIR, f"{content_hash}.jpg")
+    if content is not None and not os.path.exists(image_path):
+        _write_file(image_path, content)
+    if not os.path.exists(thumbnail_path):
+        if content is None:
+            with open(image_path, "rb") as file:
+                content = file.read()
+        _write_file(thumbnail_path, create_thumbnail(content))
+    _link_file(image_path, os.path.join(IMAGE_DIR, f"{product_id}.jpg"))
+    _link_file(thumbnail_path, os.path.join(THUMBNAIL_DIR, f"{product_id}.jpg"))
+
+
+def request_product_image(session, product_id, url, synced_image=None, timeout=30):
+    """
+    Downloads a product image, conditionally if it has been synced from the same URL.
+
+        Parameters:
+                session (requests.Session): Session used to make the request
+                product_id (int): Getic's product ID
+                url (str): Image URL
+                synced_image (dict): URL, ETag, Last-Modified and hash of the last sync
+                timeout (int): Request timeout in seconds
+
+        Returns:
+                image (dict): Sync state of the image, None if the download failed
+    """
+    headers = {}
+    if synced_image is not None and synced_image["url"] == url:
+        if synced_image["etag"]:
+            headers["If-None-Match"] = synced_image["etag"]
+        if synced_image["last_modified"]:
+            headers["If-Modified-Since"] = synced_image["last_modified"]
+    try:
+        r = session.get(url, headers=headers, timeout=timeout)
+        if r.status_code == 304:
+            store_product_image(product_id, synced_image["content_hash"])
+            return dict(synced_image, time_synced=datetime.now(timezone.utc))
+        r.raise_for_status()
+        content_hash = hashlib.sha256(r.content).hexdigest()
+        store_product_image(product_id, content_hash, r.content)
+    except Exception as error:
+        print(f"Error, unable to sync image {url}: {error}")
+        return None
+    return {
+        "product_id": product_id,
+        "url": url,
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "content_hash": content_hash,
+        "time_synced": datetime.now(timezone.utc),
+    }
+
+
+def sync_product_images(db, max_workers=8, timeout=30, revalidate=False):
+    """
+    Downloads the images of the current products that are new or whose URL changed,
+    concurrently over a shared connection pool, and generates their thumbnails.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                max_workers (int): Maximum number of concurrent downloads
+                timeout (int): Per-request timeout in seconds
+                revalidate (bool): Also checks unchanged URLs for new content (ETag)
+
+        Returns:
+                synced_count (int): Number of images synced
+    """
+    os.makedirs(os.path.join(IMAGE_DIR, OBJECT_DIR), exist_ok=True)
+    os.makedirs(os.path.join(THUMBNAIL_DIR, OBJECT_DIR), exist_ok=True)
+    start_time = time.perf_counter()
+    synced_images = {
+        image.product_id: {
+            "product_id": image.product_id,
+            "url": image.url,
+            "etag": image.etag,
+            "last_modified": image.last_modified,
+            "content_hash": image.content_hash,
+        }
+        for image in ProductImage.query
+    }
+    pending = []
+    for product_id, url in db.session.query(
+        CurrentProduct.product_id, CurrentProduct.image
+    ):
+        synced_image = synced_images.get(product_id)
+        if (
+            revalidate
+            or synced_image is None
+            or synced_image["url"] != url
+            or not os.path.exists(os.path.join(THUMBNAIL_DIR, f"{product_id}.jpg"))
+        ):
+            pending.append((product_id, url, synced_image))
+    print(f"Syncing {len(pending)} images...")
+    synced_count = 0
+    with create_session(max_workers, verify=True) as session:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            images = executor.map(
+                lambda image: request_product_image(session, *image, timeout),
+                pending,
+            )
+            for image in images:
+                if image is None:
+                    continue
+                db.session.merge(ProductImage(**image))
+                synced_count += 1
+                if synced_count % 500 == 0:
+                    db.session.commit()
+    db.session.commit()
+    print(
+        f"Synced {synced_count} images in {time.perf_counter() - start_time:.2f}s..."
+    )
+    return synced_count
@@ -0,0 +1,108 @@
+from main import app, db
+from main.get_products import (
+    load_proxy_pool,
+    iter_products_from_api,
+    write_products_to_db,
+)
+from main.analytics import run_analytics
+from main.checkpoints import clear_checkpoints
+from main.images import sync_product_images
+from main.page_cache import clear_page_cache, warm_page_cache
+from main.metrics import time_stage, write_metrics_textfile
+from contextlib import contextmanager
+from sqlalchemy import text
+import traceback
+
+INGESTION_LOCK_KEY = 7305274  # Advisory lock shared by every ingestion process
+
+
+@contextmanager
+def ingestion_lock(db):
+    """
+    Holds a PostgreSQL session advisory lock, so only one ingestion runs at a
+    time across processes and hosts. The lock is released when the block exits,
+    or by the server if the process dies.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+
+        Yields:
+                locked (bool): False if another ingestion holds the lock
+    """
+    if db.engine.dialect.name != "postgresql":
+        yield True
+        return
+    with db.engine.connect().execution_options(
+        isolation_level="AUTOCOMMIT"
+    ) as connection:
+        locked = connection.execute(
+            text("SELECT pg_try_advisory_lock(:key)"), {"key": INGESTION_LOCK_KEY}
+        ).scalar()
+        try:
+            yield locked
+        finally:
+            if locked:
+                connection.execute(
+                    text("SELECT pg_advisory_unlock(:key)"),
+                    {"key": INGESTION_LOCK_KEY},
+                )
+
+
+@contextmanager
+def post_write_stage(stage):
+    """
+    Times a stage running after the run is committed. Its failure is logged and
+    not raised: the run is complete, so the ingestion must not be resumed.
+
+        Parameters:
+                stage (str): Stage name (analytics, image_sync...)
+    """
+    try:
+        with time_stage(stage):
+            yield
+    except Exception as error:
+        print(f"Error, {stage} stage failed after the run was written: {error}")
+        traceback.print_exc()
+
+
+def run_ingestion(use_proxies=False, sync_images=True):
+    """
+    Gets the current product data from Getic's API and updates the database,
+    unless another ingestion is already running. A failed ingestion resumes
+    from the categories already fetched the next time it is run on the same day.
+
+        Parameters:
+                use_proxies (bool): Makes the requests through the proxy pool
+                sync_images (bool): Downloads new and changed product images
+
+        Returns:
+                ran (bool): False if the ingestion was skipped
+    """
+    with app.app_context():
+        with ingestion_lock(db) as locked:
+            if not locked:
+                print("Another ingestion is running, skipping...")
+                return False
+            print("Updating products...")
+            try:
+                proxy_pool = load_proxy_pool() if use_proxies else None
+                with time_stage("run"):
+                    write_products_to_db(db, iter_products_from_api(proxy_pool))
+                clear_checkpoints()
+                print("Products updated...")
+                with post_write_stage("analytics"):
+                    run_analytics(db)
+                # Only a shared cache outlives this process, web processes
+                # switch to the new run's keys on their own
+                if app.config["PAGE_CACHE_REDIS_URL"]:
+                    with post_write_stage("page_cache_warm"):
+                        clear_page_cache()
+                        if app.config["PAGE_CACHE_PREWARM"]:
+                            warm_page_cache()
+                if sync_images:
+                    with post_write_stage("image_sync"):
+                        sync_product_images(db)
+            finally:
+                if app.config["METRICS_TEXTFILE"]:
+                    write_metrics_textfile(app.config["METRICS_TEXTFILE"])
+    return True
@@ -0,0 +1,251 @@
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from contextlib import contextmanager
+import bisect
+import os
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+STAGE_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800)
+SLOW_QUERY_LENGTH = 500  # Characters of a slow statement written to the log
+
+registry = []  # Every metric, in the order they are rendered
+
+
+class Metric:
+    """
+    Metric with one value per combination of label values, rendered in the
+    Prometheus text exposition format.
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _labels(self, labels, extra=()):
+        pairs = list(zip(self.labelnames, labels)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (
+            (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+            for name, value in pairs
+        )
+        return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in sorted(values):
+            lines.extend(self._render_value(labels, value))
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _render_value(self, labels, value):
+        return [f"{self.name}{self._labels(labels)} {value}"]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+    def _render_value(self, labels, value):
+        return [f"{self.name}{self._labels(labels)} {value}"]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, *labels, value):
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # Per bucket counts, then the +Inf count and the sum
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def _render_value(self, labels, counts):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += count
+            le = self._labels(labels, [("le", bound)])
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        lines.append(f"{self.name}_sum{self._labels(labels)} {counts[-1]}")
+        lines.append(f"{self.name}_count{self._labels(labels)} {cumulative}")
+        return lines
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Latency of the app's routes.",
+    ("method", "route", "status"),
+)
+request_queries = Histogram(
+    "http_request_queries",
+    "SQL statements executed per request.",
+    ("route",),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+request_query_duration = Histogram(
+    "http_request_query_duration_seconds",
+    "Total database time per request.",
+    ("route",),
+)
+query_duration = Histogram("db_query_duration_seconds", "Latency of SQL statements.")
+slow_queries = Counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_MS.")
+ingestion_stage_duration = Histogram(
+    "ingestion_stage_duration_seconds",
+    "Duration of the ingestion stages (fetch per category, write, image sync).",
+    ("stage", "category"),
+    buckets=STAGE_BUCKETS,
+)
+ingestion_stage_last_duration = Gauge(
+    "ingestion_stage_last_duration_seconds",
+    "Duration of the latest run of each ingestion stage.",
+    ("stage", "category"),
+)
+ingestion_stage_failures = Counter(
+    "ingestion_stage_failures_total",
+    "Failed ingestion stages.",
+    ("stage", "category"),
+)
+ingestion_products = Gauge(
+    "ingestion_products",
+    "Products fetched per category by the latest run.",
+    ("category",),
+)
+
+
+@contextmanager
+def time_stage(stage, category=""):
+    """
+    Times an ingestion stage, recording failures separately.
+
+        Parameters:
+                stage (str): Stage name (fetch, write, image_sync...)
+                category (str): Category slug of per-category stages
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        ingestion_stage_failures.inc(stage, category)
+        raise
+    duration = time.perf_counter() - start_time
+    ingestion_stage_duration.observe(stage, category, value=duration)
+    ingestion_stage_last_duration.set(stage, category, value=duration)
+
+
+def render_metrics():
+    """
+    Renders every metric in the Prometheus text exposition format.
+
+        Returns:
+                metrics (str): Exposition text
+    """
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_textfile(path):
+    """
+    Writes every metric to a file atomically, for the textfile collector of the
+    node exporter to publish the metrics of processes without a web server.
+
+        Parameters:
+                path (str): Destination, ending in .prom
+    """
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w") as file:
+        file.write(render_metrics())
+    os.replace(temporary_path, path)
+
+
+def install_instrumentation(app):
+    """
+    Times every SQL statement and request, counts the statements of each
+    request and logs statements slower than SLOW_QUERY_MS. Costs two clock
+    reads per statement and per request.
+
+        Parameters:
+                app (Flask object): App to instrument
+    """
+    slow_query_seconds = None
+    if app.config["SLOW_QUERY_MS"] is not None:
+        slow_query_seconds = app.config["SLOW_QUERY_MS"] / 1000
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_start_time"] = time.perf_counter()
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def finish_query(conn, cursor, statement, parameters, context, executemany):
+        start_time = conn.info.pop("query_start_time", None)
+        if start_time is None:
+            return
+        duration = time.perf_counter() - start_time
+        query_duration.observe(value=duration)
+        if has_request_context():
+            g.query_count = g.get("query_count", 0) + 1
+            g.query_duration = g.get("query_duration", 0) + duration
+        if slow_query_seconds is not None and duration >= slow_query_seconds:
+            slow_queries.inc()
+            app.logger.warning(
+                "Slow query (%.0fms): %s",
+                duration * 1000,
+                " ".join(statement.split())[:SLOW_QUERY_LENGTH],
+            )
+
+    @app.before_request
+    def start_request():
+        g.request_start_time = time.perf_counter()
+
+    @app.after_request
+    def finish_request(response):
+        start_time = g.get("request_start_time")
+        if start_time is None:
+            return response
+        duration = time.perf_counter() - start_time
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        query_count = g.get("query_count", 0)
+        query_time = g.get("query_duration", 0)
+        request_duration.observe(
+            request.method, route, response.status_code, value=duration
+        )
+        request_queries.observe(route, value=query_count)
+        request_query_duration.observe(route, value=query_time)
+        response.headers["Server-Timing"] = (
+            f'db;dur={query_time * 1000:.1f};desc="{query_count} queries", '
+            f"app;dur={duration * 1000:.1f}"
+        )
+        return response
@@ -1,6 +1,7 @@
 from main import db, login_manager, app
 from flask_login import UserMixin
 from sqlalchemy.sql import func
+from sqlalchemy.dialects import postgresql
 from datetime import datetime
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 
@@ -32,8 +33,7 @@ class User(db.Model, UserMixin):
         return f"User('{self.email}', '{self.password}')"
 
 
-class Product(db.Model):
-    __tablename__ = "products"
+class ProductColumns:
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, nullable=False)
     product_name = db.Column(db.String(200), nullable=False)
@@ -52,3 +52,239 @@ class Product(db.Model):
 
     def __repr__(self):
         return f"Product('{self.id}', '{self.product_name}', '{self.brand}', '{self.product_id}', '{self.category}', '{self.subcategory}', '{self.price}', '{self.stock}', '{self.sold_all_time}', '{self.sold_thirty_days}', '{self.sold_seven_days}', '{self.run_number}', '{self.time_created}')"
+
+
+class Product(ProductColumns, db.Model):
+    __tablename__ = "products"
+    __table_args__ = (
+        # Dashboard reads: latest run, optionally filtered, ordered by a sort column
+        db.Index("ix_products_run_number_sold_all_time", "run_number", "sold_all_time"),
+        db.Index(
+            "ix_products_run_number_sold_thirty_days", "run_number", "sold_thirty_days"
+        ),
+        db.Index(
+            "ix_products_run_number_sold_seven_days", "run_number", "sold_seven_days"
+        ),
+        db.Index("ix_products_run_number_price", "run_number", "price"),
+        db.Index(
+            "ix_products_run_number_category_sold_all_time",
+            "run_number",
+            "category",
+            "sold_all_time",
+        ),
+        db.Index(
+            "ix_products_run_number_brand_sold_all_time",
+            "run_number",
+            "brand",
+            "sold_all_time",
+        ),
+        # Ingestion: product history and reference snapshots by day
+        db.Index("ix_products_product_id_run_number", "product_id", "run_number"),
+        db.Index("ix_products_time_created", "time_created"),
+    )
+
+
+# Latest completed snapshot of every product, swapped in by ingestion
+class CurrentProduct(ProductColumns, db.Model):
+    __tablename__ = "current_products"
+    __table_args__ = (
+        db.Index("ix_current_products_category", "category"),
+        db.Index("ix_current_products_brand", "brand"),
+        db.Index("ix_current_products_subcategory_id", "subcategory_id"),
+        # Keyset pagination: sort column with product ID as tie-breaker
+        db.Index(
+            "ix_current_products_sold_all_time_product_id",
+            "sold_all_time",
+            "product_id",
+        ),
+        db.Index(
+            "ix_current_products_sold_thirty_days_product_id",
+            "sold_thirty_days",
+            "product_id",
+        ),
+        db.Index(
+            "ix_current_products_sold_seven_days_product_id",
+            "sold_seven_days",
+            "product_id",
+        ),
+        db.Index("ix_current_products_price_product_id", "price", "product_id"),
+        # Substring search and similarity ranking (pg_trgm)
+        db.Index(
+            "ix_current_products_product_name_trgm",
+            "product_name",
+            postgresql_using="gin",
+            postgresql_ops={"product_name": "gin_trgm_ops"},
+        ),
+    )
+
+
+# Static product attributes, used by the delta storage mode
+class ProductDetails(db.Model):
+    __tablename__ = "product_details"
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    product_name = db.Column(db.String(200), nullable=False)
+    brand = db.Column(db.String(200), nullable=False)
+    category = db.Column(db.String(200), nullable=False)
+    subcategory = db.Column(db.String(200), nullable=False)
+    subcategory_id = db.Column(db.Integer, nullable=False)
+    image = db.Column(db.String(400), nullable=False)
+    time_updated = db.Column(
+        db.DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+    def __repr__(self):
+        return f"ProductDetails('{self.product_id}', '{self.product_name}', '{self.brand}', '{self.category}', '{self.subcategory}')"
+
+
+# Price and stock of a product, recorded only in runs where they changed
+class ProductSnapshot(db.Model):
+    __tablename__ = "product_snapshots"
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    run_number = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    price = db.Column(db.Numeric(10, 2), nullable=False)
+    stock = db.Column(db.Integer, nullable=False)
+    sold_all_time = db.Column(db.Integer, nullable=False)
+    removed = db.Column(db.Boolean, nullable=False, default=False)  # Left the catalogue
+
+    def __repr__(self):
+        return f"ProductSnapshot('{self.product_id}', '{self.run_number}', '{self.price}', '{self.stock}', '{self.sold_all_time}', '{self.removed}')"
+
+
+# Weekly or monthly roll-up of product snapshots removed by history compaction
+class ProductSummary(db.Model):
+    __tablename__ = "product_summaries"
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    period = db.Column(db.String(10), primary_key=True)  # week or month
+    period_start = db.Column(db.Date, primary_key=True)
+    product_name = db.Column(db.String(200), nullable=False)
+    brand = db.Column(db.String(200), nullable=False)
+    category = db.Column(db.String(200), nullable=False)
+    run_count = db.Column(db.Integer, nullable=False)
+    first_run_number = db.Column(db.Integer, nullable=False)
+    last_run_number = db.Column(db.Integer, nullable=False)
+    min_price = db.Column(db.Numeric(10, 2), nullable=False)
+    max_price = db.Column(db.Numeric(10, 2), nullable=False)
+    total_price = db.Column(db.Numeric(14, 2), nullable=False)  # Sum over the runs
+    min_stock = db.Column(db.Integer, nullable=False)
+    max_stock = db.Column(db.Integer, nullable=False)
+    last_stock = db.Column(db.Integer, nullable=False)
+    first_sold_all_time = db.Column(db.Integer, nullable=False)
+    last_sold_all_time = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f"ProductSummary('{self.product_id}', '{self.period}', '{self.period_start}', '{self.run_count}', '{self.first_sold_all_time}', '{self.last_sold_all_time}')"
+
+
+# Price, stock and sales history of a product, one array element per run
+class ProductHistory(db.Model):
+    __tablename__ = "product_histories"
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    run_numbers = db.Column(postgresql.ARRAY(db.Integer), nullable=False)
+    prices = db.Column(postgresql.ARRAY(db.Integer), nullable=False)  # Cents
+    stocks = db.Column(postgresql.ARRAY(db.Integer), nullable=False)
+    sold_all_time = db.Column(postgresql.ARRAY(db.Integer), nullable=False)
+    time_updated = db.Column(
+        db.DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+    def __repr__(self):
+        return f"ProductHistory('{self.product_id}', '{len(self.run_numbers)}', '{self.time_updated}')"
+
+
+# Number of current products per category, subcategory and brand,
+# precomputed by ingestion for the faceted products API
+class ProductFacet(db.Model):
+    __tablename__ = "product_facets"
+    dimension = db.Column(db.String(20), primary_key=True)  # category, subcategory...
+    value = db.Column(db.String(200), primary_key=True)
+    label = db.Column(db.String(200), nullable=False)
+    product_count = db.Column(db.Integer, nullable=False)
+    in_stock_count = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f"ProductFacet('{self.dimension}', '{self.value}', '{self.product_count}')"
+
+
+# Units each product sold per day, derived from stock decreases between runs.
+# Only days with sales are recorded.
+class ProductDailySales(db.Model):
+    __tablename__ = "product_daily_sales"
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    day = db.Column(db.Date, primary_key=True)
+    sold = db.Column(db.Integer, nullable=False)
+    __table_args__ = (db.Index("ix_product_daily_sales_day", "day", "product_id"),)
+
+    def __repr__(self):
+        return f"ProductDailySales('{self.product_id}', '{self.day}', '{self.sold}')"
+
+
+# Sales velocity, movers, restock and price change statistics as of a run
+class ProductAnalytics(db.Model):
+    __tablename__ = "product_analytics"
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    run_number = db.Column(db.Integer, nullable=False)
+    category = db.Column(db.String(200), nullable=False)
+    stock = db.Column(db.Integer)
+    sold_seven_days = db.Column(db.Integer, nullable=False)
+    sold_previous_seven_days = db.Column(db.Integer, nullable=False)
+    sold_thirty_days = db.Column(db.Integer, nullable=False)
+    velocity_seven_days = db.Column(db.Float)  # Average units sold per day
+    velocity_twenty_eight_days = db.Column(db.Float)
+    week_over_week = db.Column(db.Float)  # Relative change of the units sold
+    sold_change = db.Column(db.Integer, nullable=False)
+    mover_rank = db.Column(db.Integer, nullable=False)  # Within the category
+    sell_through = db.Column(db.Float)  # Sold over sold and stock, thirty days
+    days_of_stock = db.Column(db.Float)
+    restock_count = db.Column(db.Integer, nullable=False)
+    last_restock_run = db.Column(db.Integer)
+    restock_interval = db.Column(db.Float)  # Average days between restocks
+    price_change_count = db.Column(db.Integer, nullable=False)
+    last_price_change_run = db.Column(db.Integer)
+    last_price_change = db.Column(db.Float)  # Relative change
+    time_computed = db.Column(db.DateTime(timezone=True), server_default=func.now())
+    __table_args__ = (
+        db.Index("ix_product_analytics_category_mover_rank", "category", "mover_rank"),
+        db.Index("ix_product_analytics_sold_change", "sold_change"),
+    )
+
+    def __repr__(self):
+        return f"ProductAnalytics('{self.product_id}', '{self.run_number}', '{self.velocity_seven_days}', '{self.week_over_week}', '{self.mover_rank}')"
+
+
+# Restock and price change events detected by the analytics engine
+class ProductEvent(db.Model):
+    __tablename__ = "product_events"
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    run_number = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    kind = db.Column(db.String(20), primary_key=True)  # restock or price_change
+    value = db.Column(db.Float, nullable=False)  # Units restocked or relative change
+
+    def __repr__(self):
+        return f"ProductEvent('{self.product_id}', '{self.run_number}', '{self.kind}', '{self.value}')"
+
+
+# Sync state of each product's image, mirrored into main/static/img
+class ProductImage(db.Model):
+    __tablename__ = "product_images"
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    url = db.Column(db.String(400), nullable=False)
+    etag = db.Column(db.String(200))
+    last_modified = db.Column(db.String(100))
+    content_hash = db.Column(db.String(64), nullable=False)  # SHA-256
+    time_synced = db.Column(db.DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"ProductImage('{self.product_id}', '{self.url}', '{self.content_hash}', '{self.time_synced}')"
+
+
+class Run(db.Model):
+    __tablename__ = "runs"
+    run_number = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    time_started = db.Column(db.DateTime(timezone=True), server_default=func.now())
+    time_finished = db.Column(db.DateTime(timezone=True))
+    status = db.Column(db.String(20), nullable=False, default="running")
+    product_count = db.Column(db.Integer)
+    duration = db.Column(db.Float)  # Seconds
+
+    def __repr__(self):
+        return f"Run('{self.run_number}', '{self.status}', '{self.product_count}', '{self.time_started}', '{self.time_finished}', '{self.duration}')"
@@ -0,0 +1,351 @@
+from main import app, db
+from main.models import CurrentProduct
+from main.runs import read_latest_run_number
+from main.snapshot_engine import ROUTE_DIMENSIONS, get_snapshot_index
+from main.calculate_stats import (
+    calculate_product_stats,
+    SORT_COLUMNS,
+    seek_products,
+    encode_cursor,
+    decode_cursor,
+    query_category_products,
+    query_brand_products,
+    query_searched_products,
+)
+from flask import abort
+from werkzeug.exceptions import NotFound
+from collections import Counter, OrderedDict
+import json
+import math
+import pickle
+import threading
+
+PER_PAGE = 72
+MAX_TRACKED_PAGES = 10000  # Bounds the hit counter, search terms are unbounded
+
+# Builds the products query of each cached route from its filter and sort
+PAGE_QUERIES = {
+    "categories": query_category_products,
+    "brands": query_brand_products,
+    "search": query_searched_products,
+}
+
+
+class ProductPage:
+    """
+    Picklable page of products exposing the parts of Flask-SQLAlchemy's
+    Pagination used by the templates.
+    """
+
+    def __init__(self, items, page, per_page, total, next_cursor=None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.next_cursor = next_cursor  # Keyset cursor of the following page
+
+    @property
+    def pages(self):
+        if self.total == 0:
+            return 0
+        return math.ceil(self.total / self.per_page)
+
+    def iter_pages(self, left_edge=2, left_current=2, right_current=4, right_edge=2):
+        pages_end = self.pages + 1
+        if pages_end == 1:
+            return
+        left_end = min(1 + left_edge, pages_end)
+        yield from range(1, left_end)
+        if left_end == pages_end:
+            return
+        mid_start = max(left_end, self.page - left_current)
+        mid_end = min(self.page + right_current + 1, pages_end)
+        if mid_start - left_end > 0:
+            yield None
+        yield from range(mid_start, mid_end)
+        if mid_end == pages_end:
+            return
+        right_start = max(mid_end, pages_end - right_edge)
+        if right_start - mid_end > 0:
+            yield None
+        yield from range(right_start, pages_end)
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+class LRUCache:
+    """
+    Thread-safe in-process cache evicting the least recently used entries.
+    """
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCache:
+    """
+    Cache shared between processes through a Redis-compatible server.
+    """
+
+    def __init__(
+        self,
+        url,
+        prefix="getic-analytics:page:",
+        hits_key="getic-analytics:page-hits",
+        timeout=86400,
+    ):
+        import redis  # Only needed when a Redis URL is configured
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.hits_key = hits_key  # Sorted set of page hits, kept across runs
+        self.timeout = timeout
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        return pickle.loads(value)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=self.timeout)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + "*"):
+            self.client.delete(key)
+
+    def record_hit(self, page):
+        pipeline = self.client.pipeline()
+        pipeline.zincrby(self.hits_key, 1, json.dumps(page))
+        pipeline.zcard(self.hits_key)
+        _, tracked_count = pipeline.execute()
+        if tracked_count > MAX_TRACKED_PAGES:
+            # Keeps the most requested tenth, like the in-process counter
+            self.client.zremrangebyrank(
+                self.hits_key, 0, -(MAX_TRACKED_PAGES // 10) - 1
+            )
+
+    def most_requested(self, limit):
+        pages = self.client.zrevrange(self.hits_key, 0, limit - 1)
+        return [tuple(json.loads(page)) for page in pages]
+
+
+def create_page_cache():
+    """
+    Creates the page cache configured for the app.
+
+        Returns:
+                cache (LRUCache or RedisCache): Page cache
+    """
+    if app.config["PAGE_CACHE_REDIS_URL"]:
+        return RedisCache(app.config["PAGE_CACHE_REDIS_URL"])
+    return LRUCache(app.config["PAGE_CACHE_SIZE"])
+
+
+page_cache = create_page_cache()
+page_hits = Counter()  # Requests per (route, filter, sort, page), used for pre-warming
+page_hits_lock = threading.Lock()  # Request threads count hits concurrently
+
+
+def record_page_hit(page):
+    """
+    Counts a request of a page, in Redis when the page cache is shared so the
+    ingestion process warms the pages requested from every web process.
+
+        Parameters:
+                page (tuple): Route, filter, sort and page number
+    """
+    if isinstance(page_cache, RedisCache):
+        page_cache.record_hit(page)
+        return
+    with page_hits_lock:
+        page_hits[page] += 1
+        if len(page_hits) > MAX_TRACKED_PAGES:
+            popular_pages = page_hits.most_common(MAX_TRACKED_PAGES // 10)
+            page_hits.clear()
+            page_hits.update(dict(popular_pages))
+
+
+def get_popular_pages(limit):
+    """
+    Gets the most requested pages, most requested first.
+
+        Parameters:
+                limit (int): Number of pages
+
+        Returns:
+                pages (list): (route, filter, sort, page) tuples
+    """
+    if isinstance(page_cache, RedisCache):
+        return page_cache.most_requested(limit)
+    with page_hits_lock:
+        return [page for page, hits in page_hits.most_common(limit)]
+
+
+def build_product_page(route, filter, sort, page, after=None):
+    """
+    Queries a page of current products and the aggregates of the whole listing.
+    When the cursor of the previous page is known, the page is fetched with
+    a keyset seek instead of an OFFSET.
+
+        Parameters:
+                route (str): Listing route (categories, brands or search)
+                filter (str): Category, brand or searched term
+                sort (str): Sort type (total-highest, price-lowest...)
+                page (int): Page number
+                after (str): Cursor of the last product on the previous page
+
+        Returns:
+                products_page (ProductPage): Products on the page
+                stats (ProductStats): Totals over the whole listing
+    """
+    if page < 1:
+        abort(404)
+    products = PAGE_QUERIES[route](filter, sort)
+    stats = calculate_product_stats(products)
+    cursor = decode_cursor(sort, after)
+    if cursor is not None:
+        page_products = seek_products(products, sort, cursor).limit(PER_PAGE)
+    else:
+        page_products = products.offset((page - 1) * PER_PAGE).limit(PER_PAGE)
+    columns = [column.name for column in CurrentProduct.__table__.columns]
+    items = [
+        {column: getattr(product, column) for column in columns}
+        for product in page_products
+    ]
+    if not items and page != 1:
+        abort(404)
+    next_cursor = None
+    if items and sort in SORT_COLUMNS and page * PER_PAGE < stats.total_products:
+        next_cursor = encode_cursor(sort, items[-1])
+    return (
+        ProductPage(items, page, PER_PAGE, stats.total_products, next_cursor),
+        stats,
+    )
+
+
+def build_snapshot_page(route, filter, sort, page):
+    """
+    Slices a page of current products and the aggregates of the whole listing
+    from the in-memory snapshot of the latest run, without querying products.
+
+        Parameters:
+                route (str): Listing route (categories or brands)
+                filter (str): Category slug or brand name
+                sort (str): Sort type of SORT_COLUMNS
+                page (int): Page number
+
+        Returns:
+                products_page (ProductPage): Products on the page
+                stats (ProductStats): Totals over the whole listing
+    """
+    if page < 1:
+        abort(404)
+    index = get_snapshot_index(db)
+    positions, stats = index.select(route, filter, sort)
+    items = index.rows_at(positions[(page - 1) * PER_PAGE : page * PER_PAGE])
+    if not items and page != 1:
+        abort(404)
+    next_cursor = None
+    if items and page * PER_PAGE < stats.total_products:
+        next_cursor = encode_cursor(sort, items[-1])
+    return (
+        ProductPage(items, page, PER_PAGE, stats.total_products, next_cursor),
+        stats,
+    )
+
+
+def get_product_page(route, filter, sort, page, after=None):
+    """
+    Gets a page of current products and the listing aggregates, from the cache
+    when the latest run has already been queried with the same arguments.
+    With SNAPSHOT_ENGINE enabled, category and brand listings are sliced from
+    the in-memory snapshot instead, which is cheaper than a cache lookup.
+
+        Parameters:
+                route (str): Listing route (categories, brands or search)
+                filter (str): Category, brand or searched term
+                sort (str): Sort type (total-highest, price-lowest...)
+                page (int): Page number
+                after (str): Cursor of the last product on the previous page
+
+        Returns:
+                products_page (ProductPage): Products on the page
+                stats (ProductStats): Totals over the whole listing
+    """
+    if page < 1:
+        abort(404)
+    if after is None:
+        record_page_hit((route, filter, sort, page))
+    if (
+        app.config["SNAPSHOT_ENGINE"]
+        and route in ROUTE_DIMENSIONS
+        and sort in SORT_COLUMNS
+    ):
+        return build_snapshot_page(route, filter, sort, page)
+    key = page_cache_key(route, filter, sort, page, after)
+    cached = page_cache.get(key)
+    if cached is None:
+        cached = build_product_page(route, filter, sort, page, after)
+        page_cache.set(key, cached)
+    return cached
+
+
+def page_cache_key(route, filter, sort, page, after=None):
+    """
+    Builds the cache key of a page, versioned by the latest completed run
+    so pages of older runs are never served. The run number is read from the
+    database, a cached one could store the new run's pages under an old key.
+    """
+    return f"{route}:{read_latest_run_number(db)}:{sort}:{page}:{after}:{filter}"
+
+
+def clear_page_cache():
+    """
+    Removes all cached pages, called once a new run has been committed.
+    """
+    page_cache.clear()
+
+
+def warm_page_cache(limit=50):
+    """
+    Fills the cache with the most requested pages of the latest run. Called by
+    ingestion when the cache is shared through Redis.
+
+        Parameters:
+                limit (int): Number of most requested pages to cache
+    """
+    popular_pages = get_popular_pages(limit)
+    if ("categories", "all-products", "total-highest", 1) not in popular_pages:
+        popular_pages.insert(0, ("categories", "all-products", "total-highest", 1))
+    print("Warming page cache...")
+    for route, filter, sort, page in popular_pages:
+        try:
+            page_cache.set(
+                page_cache_key(route, filter, sort, page),
+                build_product_page(route, filter, sort, page),
+            )
+        except NotFound:
+            continue  # The page no longer exists in the latest run
+    print(f"Page cache warmed with {len(popular_pages)} pages...")
@@ -0,0 +1,216 @@
+from urllib3.exceptions import InsecureRequestWarning
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import random
+import threading
+import time
+
+DEFAULT_LATENCY = 1.0  # Assumed latency in seconds of proxies not measured yet
+LATENCY_SMOOTHING = 0.3  # Weight of the newest sample in the latency average
+MAX_FAILURES = 2  # Consecutive failures after which a proxy is ejected
+COOLDOWN = 30  # Seconds a proxy is ejected for, doubled on each repeated ejection
+MAX_COOLDOWN = 900
+
+
+class ProxyStats:
+    """
+    Health of a single proxy, updated by probes and by ingestion requests.
+    """
+
+    def __init__(self, proxy):
+        self.proxy = proxy
+        self.latency = None  # Exponential moving average of the response time
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0
+
+    @property
+    def success_rate(self):
+        # Smoothed, so a single request does not decide a proxy's fate
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    @property
+    def score(self):
+        # Expected seconds per successful request, lower is better
+        latency = DEFAULT_LATENCY if self.latency is None else self.latency
+        return latency / self.success_rate
+
+    def record_latency(self, latency):
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+
+    def is_available(self, now):
+        return self.ejected_until <= now
+
+    def __repr__(self):
+        return f"ProxyStats('{self.proxy}', '{self.score:.3f}', '{self.success_rate:.2f}', '{self.ejected_until}')"
+
+
+class ProxyPool:
+    """
+    Thread-safe pool of proxies, scored by latency and success rate.
+    Each request is made through one of the best available proxies, proxies
+    failing repeatedly are ejected for an exponentially growing cooldown.
+    """
+
+    def __init__(self, proxies, probe_url="https://www.getic.com/"):
+        self.probe_url = probe_url
+        self._stats = {proxy: ProxyStats(proxy) for proxy in dict.fromkeys(proxies)}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._stats)
+
+    def stats(self):
+        """
+        Returns the health of every proxy, best scored first.
+        """
+        with self._lock:
+            return sorted(self._stats.values(), key=lambda stats: stats.score)
+
+    def acquire(self):
+        """
+        Picks the proxy the next request should be made through. Two proxies
+        are sampled from the best quarter of the available ones and the better
+        scored one is picked, which rotates requests over the fastest proxies.
+        When every proxy is ejected, the one coming back first is picked.
+
+            Returns:
+                    proxy (str): Proxy URL, None if the pool is empty
+        """
+        now = time.monotonic()
+        with self._lock:
+            available = sorted(
+                (stats for stats in self._stats.values() if stats.is_available(now)),
+                key=lambda stats: stats.score,
+            )
+            if not available:
+                if not self._stats:
+                    return None
+                return min(
+                    self._stats.values(), key=lambda stats: stats.ejected_until
+                ).proxy
+            candidates = available[: max(2, len(available) // 4)]
+            sampled = random.sample(candidates, min(2, len(candidates)))
+            return min(sampled, key=lambda stats: stats.score).proxy
+
+    def report(self, proxy, success, latency=None):
+        """
+        Records the outcome of a request made through a proxy.
+
+            Parameters:
+                    proxy (str): Proxy URL
+                    success (bool): Whether the request succeeded
+                    latency (float): Response time in seconds, if it was measured
+        """
+        with self._lock:
+            stats = self._stats.get(proxy)
+            if stats is None:
+                return
+            if latency is not None:
+                stats.record_latency(latency)
+            if success:
+                stats.successes += 1
+                stats.consecutive_failures = 0
+                stats.ejections = 0
+                return
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            if stats.consecutive_failures >= MAX_FAILURES:
+                self._eject(stats)
+
+    def eject(self, proxy):
+        """
+        Takes a proxy out of rotation for its cooldown.
+        """
+        with self._lock:
+            stats = self._stats.get(proxy)
+            if stats is not None:
+                self._eject(stats)
+
+    def _eject(self, stats):
+        cooldown = min(MAX_COOLDOWN, COOLDOWN * 2**stats.ejections)
+        stats.ejected_until = time.monotonic() + cooldown
+        stats.ejections += 1
+        stats.consecutive_failures = 0
+        print(f"Ejected proxy {stats.proxy} for {cooldown}s")
+
+    def observe_response(self, r, proxies=None, **kwargs):
+        """
+        Requests response hook recording the response time of the proxy a
+        request went through. Install it with session.hooks["response"].
+        """
+        proxy = (proxies or {}).get("https")
+        if proxy in self._stats and r.ok:
+            self.report_latency(proxy, r.elapsed.total_seconds())
+        return r
+
+    def report_latency(self, proxy, latency):
+        """
+        Records the response time of a request made through a proxy.
+        """
+        with self._lock:
+            stats = self._stats.get(proxy)
+            if stats is not None:
+                stats.record_latency(latency)
+
+    def probe(self, max_workers=32, timeout=10):
+        """
+        Makes a request to the probe URL through every proxy concurrently,
+        so the pool is scored before ingestion starts.
+
+            Parameters:
+                    max_workers (int): Maximum number of concurrent probes
+                    timeout (int): Per-probe timeout in seconds
+
+            Returns:
+                    healthy_count (int): Number of proxies that responded
+        """
+        requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
+
+        def probe_proxy(proxy):
+            try:
+                r = session.get(
+                    self.probe_url, proxies=as_requests_proxies(proxy), timeout=timeout
+                )
+                r.raise_for_status()
+            except Exception:
+                self.eject(proxy)  # Dead proxies are not worth a second failure
+                return False
+            self.report(proxy, True, r.elapsed.total_seconds())
+            return True
+
+        start_time = time.perf_counter()
+        with requests.Session() as session:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=max_workers, pool_maxsize=max_workers
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.verify = False
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                healthy_count = sum(executor.map(probe_proxy, list(self._stats)))
+        print(
+            f"Probed {len(self)} proxies, {healthy_count} healthy, "
+            f"in {time.perf_counter() - start_time:.2f}s"
+        )
+        return healthy_count
+
+
+def as_requests_proxies(proxy):
+    """
+    Builds the proxies argument of requests for a proxy URL.
+
+        Parameters:
+                proxy (str): Proxy URL, None for a direct connection
+
+        Returns:
+                proxies (dict): Proxy of each scheme, None for a direct connection
+    """
+    if proxy is None:
+        return None
+    return {"https": proxy, "http": proxy}
@@ -0,0 +1,213 @@
+from main.models import Product, Run
+from sqlalchemy import func
+from datetime import datetime, timedelta, timezone
+import time
+
+RUN_CACHE_SECONDS = 60  # Safety net for processes that did not finish the run
+
+_run_cache = {}
+
+
+def calculate_next_run_number(db):
+    """
+    Calculates the number of the next iteration of writing products to database.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+
+        Returns:
+                next_run_number (int): Next writing iteration
+    """
+    last_run_number = db.session.query(func.max(Run.run_number)).scalar()
+    if last_run_number is None:
+        # History written before the runs table existed
+        last_run_number = db.session.query(func.max(Product.run_number)).scalar()
+    if last_run_number is None:
+        return 1  # If there are no runs in the database, returns 1
+    return last_run_number + 1
+
+
+def start_run(db):
+    """
+    Records the start of a new iteration of writing products to database.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+
+        Returns:
+                run (Run): Started run
+    """
+    run = Run(
+        run_number=calculate_next_run_number(db),
+        time_started=datetime.now(timezone.utc),
+        status="running",
+    )
+    db.session.add(run)
+    db.session.commit()
+    return run
+
+
+def finish_run(db, run, product_count, status="completed"):
+    """
+    Records the end of an iteration of writing products to database
+    and invalidates the cached latest run.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                run (Run): Run being finished
+                product_count (int): Number of products written by the run
+                status (str): Final status of the run ("completed" or "failed")
+    """
+    run.time_finished = datetime.now(timezone.utc)
+    run.duration = (run.time_finished - run.time_started).total_seconds()
+    run.product_count = product_count
+    run.status = status
+    db.session.commit()
+    invalidate_run_cache()
+
+
+def invalidate_run_cache():
+    """
+    Clears the cached latest run number, first run date and run dates.
+    """
+    _run_cache.clear()
+
+
+def _cached(key, load):
+    cached = _run_cache.get(key)
+    if cached is not None and time.monotonic() - cached[1] < RUN_CACHE_SECONDS:
+        return cached[0]
+    value = load()
+    _run_cache[key] = (value, time.monotonic())
+    return value
+
+
+def get_latest_run_number(db):
+    """
+    Gets the number of the latest completed iteration of writing products to
+    database, cached for up to RUN_CACHE_SECONDS in processes that did not
+    write it.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+
+        Returns:
+                latest_run_number (int): Latest completed writing iteration
+    """
+    return _cached("latest_run_number", lambda: read_latest_run_number(db))
+
+
+def read_latest_run_number(db):
+    """
+    Reads the number of the latest completed iteration of writing products to
+    database, bypassing the cache.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+
+        Returns:
+                latest_run_number (int): Latest completed writing iteration
+    """
+    latest_run_number = (
+        db.session.query(func.max(Run.run_number))
+        .filter(Run.status == "completed")
+        .scalar()
+    )
+    if latest_run_number is None:
+        # History written before the runs table existed
+        latest_run_number = db.session.query(func.max(Product.run_number)).scalar()
+    return latest_run_number or 0
+
+
+def get_first_run_date(db):
+    """
+    Gets the date products started being tracked.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+
+        Returns:
+                first_run_date (date): Date of the first writing iteration
+    """
+
+    def load():
+        first_run_time = db.session.query(func.min(Run.time_started)).scalar()
+        if first_run_time is None:
+            # History written before the runs table existed
+            first_run_time = db.session.query(func.min(Product.time_created)).scalar()
+        if first_run_time is None:
+            return None
+        return first_run_time.date()
+
+    return _cached("first_run_date", load)
+
+
+def run_day(time_started):
+    """
+    Gets the day a run is recorded on, the UTC date it started on. Ledger days,
+    sales windows and ingestion checkpoints all use this date.
+
+        Parameters:
+                time_started (datetime): Start time of the run (timezone aware)
+
+        Returns:
+                day (date): UTC date of the run
+    """
+    return time_started.astimezone(timezone.utc).date()
+
+
+def select_run_numbers(db, run_number=None, start_date=None, end_date=None):
+    """
+    Selects the completed runs matching a run number and a range of run days.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                run_number (int): Run to select
+                start_date (date): First UTC day of the runs
+                end_date (date): Last UTC day of the runs (inclusive)
+
+        Returns:
+                run_numbers (list): Run numbers, in ascending order
+    """
+    runs = db.session.query(Run.run_number).filter(Run.status == "completed")
+    if run_number is not None:
+        runs = runs.filter(Run.run_number == run_number)
+    if start_date is not None:
+        runs = runs.filter(
+            Run.time_started
+            >= datetime.combine(start_date, datetime.min.time(), timezone.utc)
+        )
+    if end_date is not None:
+        runs = runs.filter(
+            Run.time_started
+            < datetime.combine(
+                end_date + timedelta(1), datetime.min.time(), timezone.utc
+            )
+        )
+    return [run for run, in runs.order_by(Run.run_number)]
+
+
+def get_run_dates(db):
+    """
+    Gets the date each iteration of writing products to database was started on.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+
+        Returns:
+                run_dates (dict): Maps run number to its UTC date (ISO 8601)
+    """
+
+    def load():
+        runs = db.session.query(Run.run_number, Run.time_started)
+        if not db.session.query(Run.run_number).first():
+            # History written before the runs table existed
+            runs = db.session.query(
+                Product.run_number, func.min(Product.time_created)
+            ).group_by(Product.run_number)
+        return {
+            run_number: run_day(time_started).isoformat()
+            for run_number, time_started in runs
+        }
+
+    return _cached("run_dates", load)
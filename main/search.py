@@ -0,0 +1,87 @@
+from main import db
+from main.models import CurrentProduct
+from sqlalchemy import case, func
+
+
+def escape_like(term):
+    """
+    Escapes LIKE wildcards so the searched term is matched literally.
+
+        Parameters:
+                term (str): Searched term
+
+        Returns:
+                escaped_term (str): Term safe to embed in a LIKE pattern
+    """
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def is_postgresql():
+    """
+    Checks whether the database supports the pg_trgm search backend.
+    """
+    return db.engine.dialect.name == "postgresql"
+
+
+def search_products(products, term):
+    """
+    Filters products whose name contains the searched term.
+    On PostgreSQL the filter is served by the pg_trgm GIN index on product_name,
+    other databases fall back to a plain case-insensitive LIKE.
+
+        Parameters:
+                products (Query): Products query to filter
+                term (str): Searched term
+
+        Returns:
+                searched_products (Query): Products matching the term
+    """
+    return products.filter(
+        CurrentProduct.product_name.ilike(f"%{escape_like(term)}%", escape="\\")
+    )
+
+
+def order_by_relevance(products, term):
+    """
+    Sorts searched products by how well their name matches the searched term.
+    On PostgreSQL products are ranked by trigram similarity, other databases
+    rank names starting with the term first and shorter names higher.
+
+        Parameters:
+                products (Query): Searched products query
+                term (str): Searched term
+
+        Returns:
+                ranked_products (Query): Products sorted by relevance
+    """
+    if is_postgresql():
+        return products.order_by(
+            func.similarity(CurrentProduct.product_name, term).desc(),
+            CurrentProduct.sold_all_time.desc(),
+        )
+    starts_with_term = CurrentProduct.product_name.ilike(
+        f"{escape_like(term)}%", escape="\\"
+    )
+    return products.order_by(
+        case((starts_with_term, 0), else_=1),
+        func.length(CurrentProduct.product_name),
+        CurrentProduct.sold_all_time.desc(),
+    )
+
+
+def autocomplete_product_names(term, limit=10):
+    """
+    Gets the names of the products best matching the searched term.
+
+        Parameters:
+                term (str): Beginning of the searched term
+                limit (int): Maximum number of suggestions
+
+        Returns:
+                product_names (list): Suggested product names
+    """
+    products = search_products(
+        CurrentProduct.query.with_entities(CurrentProduct.product_name), term
+    )
+    products = order_by_relevance(products, term).limit(limit)
+    return [product.product_name for product in products]
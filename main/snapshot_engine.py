@@ -0,0 +1,158 @@
+from main.models import CurrentProduct
+from main.runs import get_latest_run_number
+from main.calculate_stats import ProductStats, SORT_COLUMNS
+import numpy as np
+import threading
+import time
+
+# Filter dimension of each listing route served from the snapshot
+ROUTE_DIMENSIONS = {"categories": "category", "brands": "brand"}
+ALL_PRODUCTS = "all-products"
+SOLD_COLUMNS = ["sold_all_time", "sold_thirty_days", "sold_seven_days"]
+
+
+class SnapshotIndex:
+    """
+    Immutable columnar copy of the current products of a run. Every sort of
+    SORT_COLUMNS is precomputed as a permutation of the products, grouped by
+    category and by brand, with the listing aggregates of every group, so
+    pages are served by slicing arrays.
+    """
+
+    def __init__(self, run_number, rows):
+        self.run_number = run_number
+        self.rows = rows
+        product_ids = np.array([row["product_id"] for row in rows], dtype=np.int64)
+        sold = {
+            column: np.array([row[column] for row in rows], dtype=np.int64)
+            for column in SOLD_COLUMNS
+        }
+        self.totals = ProductStats(
+            len(rows), *(int(sold[column].sum()) for column in SOLD_COLUMNS)
+        )
+        # Prices compared in cents, so equal prices tie as they do in SQL
+        sort_keys = {
+            **sold,
+            "price": np.array(
+                [int(row["price"] * 100) for row in rows], dtype=np.int64
+            ),
+        }
+        self.permutations = {}  # Maps sort type to the product positions, sorted
+        for sort, (column, descending) in SORT_COLUMNS.items():
+            values = sort_keys[column.key]
+            if descending:
+                self.permutations[sort] = np.lexsort((-product_ids, -values))
+            else:
+                self.permutations[sort] = np.lexsort((product_ids, values))
+
+        self.groups = {}  # Maps dimension to {value: (positions by sort, stats)}
+        for dimension in ROUTE_DIMENSIONS.values():
+            names, codes = np.unique(
+                np.array([row[dimension] for row in rows], dtype=object).astype(str),
+                return_inverse=True,
+            )
+            counts = np.bincount(codes, minlength=len(names))
+            sums = [
+                np.bincount(codes, weights=sold[column], minlength=len(names))
+                for column in SOLD_COLUMNS
+            ]
+            bounds = np.concatenate(([0], np.cumsum(counts)))
+            # A stable sort by group keeps each group in the sort's order
+            grouped = {
+                sort: permutation[np.argsort(codes[permutation], kind="stable")]
+                for sort, permutation in self.permutations.items()
+            }
+            self.groups[dimension] = {
+                name: (
+                    {
+                        sort: ordered[bounds[code] : bounds[code + 1]]
+                        for sort, ordered in grouped.items()
+                    },
+                    ProductStats(
+                        int(counts[code]), *(int(total[code]) for total in sums)
+                    ),
+                )
+                for code, name in enumerate(names)
+            }
+
+    def select(self, route, filter, sort):
+        """
+        Selects the products of a listing in the sort's order.
+
+            Parameters:
+                    route (str): Listing route (categories or brands)
+                    filter (str): Category slug, "all-products" or brand name
+                    sort (str): Sort type of SORT_COLUMNS
+
+            Returns:
+                    positions (ndarray): Positions of the products in rows
+                    stats (ProductStats): Totals over the listing
+        """
+        if route == "categories" and filter == ALL_PRODUCTS:
+            return self.permutations[sort], self.totals
+        group = self.groups[ROUTE_DIMENSIONS[route]].get(filter)
+        if group is None:
+            return np.empty(0, dtype=np.int64), ProductStats(0, 0, 0, 0)
+        permutations, stats = group
+        return permutations[sort], stats
+
+    def rows_at(self, positions):
+        return [self.rows[position] for position in positions]
+
+
+def load_snapshot_index(db, run_number):
+    """
+    Loads the current products into a snapshot index.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                run_number (int): Run the current products belong to
+
+        Returns:
+                index (SnapshotIndex): Snapshot index
+    """
+    start_time = time.perf_counter()
+    columns = [column.name for column in CurrentProduct.__table__.columns]
+    rows = [
+        dict(zip(columns, row))
+        for row in db.session.execute(
+            CurrentProduct.__table__.select().order_by(CurrentProduct.product_id)
+        )
+    ]
+    index = SnapshotIndex(run_number, rows)
+    print(
+        f"Snapshot of run {run_number} loaded with {len(rows)} products "
+        f"in {time.perf_counter() - start_time:.2f}s..."
+    )
+    return index
+
+
+_index = None
+_reload_lock = threading.Lock()
+
+
+def get_snapshot_index(db):
+    """
+    Gets the snapshot index of the latest run. When a new run has landed, one
+    thread builds its index while the others keep serving the previous one,
+    then the new index replaces it in a single assignment.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+
+        Returns:
+                index (SnapshotIndex): Snapshot index of the latest run
+    """
+    global _index
+    run_number = get_latest_run_number(db)
+    index = _index
+    if index is not None and index.run_number == run_number:
+        return index
+    if not _reload_lock.acquire(blocking=index is None):
+        return index  # Another thread is loading the new run
+    try:
+        if _index is None or _index.run_number != run_number:
+            _index = load_snapshot_index(db, run_number)
+        return _index
+    finally:
+        _reload_lock.release()
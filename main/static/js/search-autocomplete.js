@@ -0,0 +1,22 @@
+// Suggests product names for the topbar search boxes
+(function ($) {
+  "use strict";
+
+  var timer = null;
+
+  $("input[name='searched']").on("input", function () {
+    var term = $(this).val();
+    clearTimeout(timer);
+    if (term.length < 2) {
+      return;
+    }
+    timer = setTimeout(function () {
+      $.getJSON("/search/autocomplete", { term: term }, function (names) {
+        var suggestions = $("#search-suggestions").empty();
+        $.each(names, function (index, name) {
+          suggestions.append($("<option>").attr("value", name));
+        });
+      });
+    }, 150);
+  });
+})(jQuery);
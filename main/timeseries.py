@@ -0,0 +1,163 @@
+from main import app
+from main.models import CurrentProduct, Product, ProductHistory, ProductSnapshot
+from main.runs import get_run_dates
+from sqlalchemy import Integer, func, select, text
+from sqlalchemy.dialects import postgresql
+
+MAX_BATCH_PRODUCTS = 500  # Products per batch history request
+HISTORY_ARRAYS = ["run_numbers", "prices", "stocks", "sold_all_time"]
+
+
+def _cents(price):
+    return func.round(price * 100).cast(Integer)
+
+
+def append_run_to_histories(db, run_number):
+    """
+    Appends the current products snapshot to the history arrays of its products,
+    without committing. Runs already appended are skipped, so the call is idempotent.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                run_number (int): Run held by the current products snapshot
+    """
+    insert = postgresql.insert(ProductHistory.__table__).from_select(
+        ["product_id", "run_numbers", "prices", "stocks", "sold_all_time"],
+        select(
+            CurrentProduct.product_id,
+            postgresql.array([run_number]),
+            postgresql.array([_cents(CurrentProduct.price)]),
+            postgresql.array([CurrentProduct.stock]),
+            postgresql.array([CurrentProduct.sold_all_time]),
+        ),
+    )
+    histories = ProductHistory.__table__.c
+    excluded = insert.excluded
+    db.session.execute(
+        insert.on_conflict_do_update(
+            index_elements=["product_id"],
+            set_={
+                "run_numbers": histories.run_numbers.concat(excluded.run_numbers),
+                "prices": histories.prices.concat(excluded.prices),
+                "stocks": histories.stocks.concat(excluded.stocks),
+                "sold_all_time": histories.sold_all_time.concat(
+                    excluded.sold_all_time
+                ),
+                "time_updated": func.now(),
+            },
+            where=histories.run_numbers[
+                func.array_upper(histories.run_numbers, 1)
+            ]
+            < run_number,
+        )
+    )
+
+
+def rebuild_product_histories(db):
+    """
+    Rebuilds the history arrays of every product from the stored snapshots,
+    the products table in the "full" storage mode and the snapshot deltas in
+    the "delta" mode, where only the runs a product changed in are recovered.
+    Runs already compacted into summaries are no longer stored, so their
+    entries are kept from the current arrays.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+
+        Returns:
+                product_count (int): Number of product histories written
+    """
+    if app.config["STORAGE_MODE"] == "delta":
+        source = (
+            select(ProductSnapshot)
+            .where(ProductSnapshot.removed.is_(False))
+            .subquery()
+        )
+    else:
+        source = Product.__table__
+    order = source.c.run_number
+    horizon = db.session.query(func.min(source.c.run_number)).scalar()
+
+    def aggregate(column):
+        return postgresql.array_agg(postgresql.aggregate_order_by(column, order))
+
+    if horizon is not None:
+        _trim_histories(db, horizon)
+        insert = postgresql.insert(ProductHistory.__table__).from_select(
+            ["product_id", "run_numbers", "prices", "stocks", "sold_all_time"],
+            select(
+                source.c.product_id,
+                aggregate(source.c.run_number),
+                aggregate(_cents(source.c.price)),
+                aggregate(source.c.stock),
+                aggregate(source.c.sold_all_time),
+            ).group_by(source.c.product_id),
+        )
+        histories = ProductHistory.__table__.c
+        db.session.execute(
+            insert.on_conflict_do_update(
+                index_elements=["product_id"],
+                set_={
+                    **{
+                        column: histories[column].concat(insert.excluded[column])
+                        for column in HISTORY_ARRAYS
+                    },
+                    "time_updated": func.now(),
+                },
+            )
+        )
+    db.session.commit()
+    product_count = db.session.query(func.count(ProductHistory.product_id)).scalar()
+    print(f"Rebuilt {product_count} product histories...")
+    return product_count
+
+
+def _trim_histories(db, horizon):
+    """
+    Removes the entries of the runs still stored, from the horizon on, from the
+    history arrays, keeping the compacted runs before it. Nothing is committed.
+    """
+    kept = (
+        "(SELECT count(*) FROM unnest(run_numbers) AS run_number "
+        "WHERE run_number < :horizon)"
+    )
+    db.session.execute(
+        text("DELETE FROM product_histories WHERE run_numbers[1] >= :horizon"),
+        {"horizon": horizon},
+    )
+    db.session.execute(
+        text(
+            "UPDATE product_histories SET "
+            + ", ".join(f"{column} = {column}[1:{kept}]" for column in HISTORY_ARRAYS)
+            + " WHERE run_numbers[array_upper(run_numbers, 1)] >= :horizon"
+        ),
+        {"horizon": horizon},
+    )
+
+
+def load_product_histories(db, product_ids):
+    """
+    Loads the history of the specified products in a single primary key lookup.
+
+        Parameters:
+                db (SQLAlchemy object): Database instance
+                product_ids (list): Getic's product IDs
+
+        Returns:
+                histories (dict): Maps product ID to its history, as parallel lists of
+                        dates, run numbers, prices, stocks and sold_all_time counters
+    """
+    run_dates = get_run_dates(db)
+    histories = db.session.query(ProductHistory).filter(
+        ProductHistory.product_id.in_(product_ids)
+    )
+    return {
+        history.product_id: {
+            "dates": [run_dates.get(run_number) for run_number in history.run_numbers],
+            "run_numbers": history.run_numbers,
+            "prices": [price / 100 for price in history.prices],
+            "stocks": history.stocks,
+            "sold_all_time": history.sold_all_time,
+        }
+        for history in histories
+    }
@@ -1,4 +1,14 @@
-from flask import render_template, request, redirect, url_for, flash
+from flask import (
+    render_template,
+    request,
+    redirect,
+    url_for,
+    flash,
+    jsonify,
+    abort,
+    Response,
+    stream_with_context,
+)
 from main import app, db, bcrypt, mail
 from flask_login import (
     login_user,
@@ -6,24 +16,35 @@ from flask_login import (
     current_user,
     logout_user,
 )
-from main.models import Product, User
+from main.models import User
 from main.get_products import (
     request_products_from_api,
     write_products_to_db,
     request_proxy_list,
-    calculate_current_run_number,
-    get_product_images,
 )
-from main.calculate_stats import (
-    calculate_total_items,
-    calculate_total_sold,
-    calculate_sold_thirty_days,
-    calculate_sold_seven_days,
-    map_category,
-    map_sort,
+from main.analytics import (
+    MAX_MOVERS,
+    analytics_to_dict,
+    load_product_analytics,
+    load_top_movers,
+)
+from main.runs import get_first_run_date
+from main.search import autocomplete_product_names
+from main.timeseries import MAX_BATCH_PRODUCTS, load_product_histories
+from main.metrics import render_metrics
+from main.exports import (
+    EXPORT_FORMATS,
+    iter_export_batches,
+    iter_csv_chunks,
+    iter_parquet_chunks,
+    parquet_available,
 )
+from main.calculate_stats import map_category, map_sort
+from main.facets import MAX_PER_PAGE, parse_facet_filters, query_faceted_products
+from main.page_cache import get_product_page
 from main.forms import SearchForm, LoginForm, RequestResetForm, ResetPasswordForm
 from flask_mail import Message
+from datetime import date
 
 
 @app.route("/", methods=["GET", "POST"])
@@ -114,19 +135,11 @@ def reset_token(token):
 @app.route("/main", methods=["GET", "POST"])
 @login_required
 def main():
-    latest_run_number = calculate_current_run_number(db) - 1
-    latest_run_products = Product.query.filter(
-        Product.run_number == latest_run_number
-    ).order_by(Product.sold_all_time.desc())
     page = request.args.get("page", 1, type=int)
-    products_page = latest_run_products.paginate(page=page, per_page=72)
-    first_run_date = (
-        Product.query.filter(Product.run_number == 1).first().time_created.date()
+    products_page, stats = get_product_page(
+        "categories", "all-products", "total-highest", page
     )
-    total_products = calculate_total_items(latest_run_products)
-    total_sold = calculate_total_sold(latest_run_products)
-    thirty_days_sold = calculate_sold_thirty_days(latest_run_products)
-    seven_days_sold = calculate_sold_seven_days(latest_run_products)
+    first_run_date = get_first_run_date(db)
     return render_template(
         "main.html",
         title="Dashboard",
@@ -137,10 +150,10 @@ def main():
         sort="total-highest",
         products=products_page,
         first_run_date=first_run_date,
-        total_products=total_products,
-        total_sold=total_sold,
-        thirty_days_sold=thirty_days_sold,
-        seven_days_sold=seven_days_sold,
+        total_products=stats.total_products,
+        total_sold=stats.total_sold,
+        thirty_days_sold=stats.thirty_days_sold,
+        seven_days_sold=stats.seven_days_sold,
         form=SearchForm(),
     )
 
@@ -148,105 +161,10 @@ def main():
 @app.route("/categories/<filter>/<sort>/", methods=["GET", "POST"])
 @login_required
 def categories(filter, sort):
-    latest_run_number = calculate_current_run_number(db) - 1
-    if sort == "total-lowest":
-        if filter != "all-products":
-            latest_run_products = (
-                Product.query.filter(Product.run_number == latest_run_number)
-                .filter(Product.category == filter)
-                .order_by(Product.sold_all_time.asc())
-            )
-        else:
-            latest_run_products = Product.query.filter(
-                Product.run_number == latest_run_number
-            ).order_by(Product.sold_all_time.asc())
-    elif sort == "seven-days-highest":
-        if filter != "all-products":
-            latest_run_products = (
-                Product.query.filter(Product.run_number == latest_run_number)
-                .filter(Product.category == filter)
-                .order_by(Product.sold_seven_days.desc())
-            )
-        else:
-            latest_run_products = Product.query.filter(
-                Product.run_number == latest_run_number
-            ).order_by(Product.sold_seven_days.desc())
-    elif sort == "seven-days-lowest":
-        if filter != "all-products":
-            latest_run_products = (
-                Product.query.filter(Product.run_number == latest_run_number)
-                .filter(Product.category == filter)
-                .order_by(Product.sold_seven_days.asc())
-            )
-        else:
-            latest_run_products = Product.query.filter(
-                Product.run_number == latest_run_number
-            ).order_by(Product.sold_seven_days.asc())
-    elif sort == "thirty-days-highest":
-        if filter != "all-products":
-            latest_run_products = (
-                Product.query.filter(Product.run_number == latest_run_number)
-                .filter(Product.category == filter)
-                .order_by(Product.sold_thirty_days.desc())
-            )
-        else:
-            latest_run_products = Product.query.filter(
-                Product.run_number == latest_run_number
-            ).order_by(Product.sold_thirty_days.desc())
-    elif sort == "thirty-days-lowest":
-        if filter != "all-products":
-            latest_run_products = (
-                Product.query.filter(Product.run_number == latest_run_number)
-                .filter(Product.category == filter)
-                .order_by(Product.sold_thirty_days.asc())
-            )
-        else:
-            latest_run_products = Product.query.filter(
-                Product.run_number == latest_run_number
-            ).order_by(Product.sold_thirty_days.asc())
-    elif sort == "price-highest":
-        if filter != "all-products":
-            latest_run_products = (
-                Product.query.filter(Product.run_number == latest_run_number)
-                .filter(Product.category == filter)
-                .order_by(Product.price.desc())
-            )
-        else:
-            latest_run_products = Product.query.filter(
-                Product.run_number == latest_run_number
-            ).order_by(Product.price.desc())
-    elif sort == "price-lowest":
-        if filter != "all-products":
-            latest_run_products = (
-                Product.query.filter(Product.run_number == latest_run_number)
-                .filter(Product.category == filter)
-                .order_by(Product.price.asc())
-            )
-        else:
-            latest_run_products = Product.query.filter(
-                Product.run_number == latest_run_number
-            ).order_by(Product.price.asc())
-    else:
-        if filter != "all-products":
-            latest_run_products = (
-                Product.query.filter(Product.run_number == latest_run_number)
-                .filter(Product.category == filter)
-                .order_by(Product.sold_all_time.desc())
-            )
-        else:
-            latest_run_products = Product.query.filter(
-                Product.run_number == latest_run_number
-            ).order_by(Product.sold_all_time.desc())
-
     page = request.args.get("page", 1, type=int)
-    products_page = latest_run_products.paginate(page=page, per_page=72)
-    first_run_date = (
-        Product.query.filter(Product.run_number == 1).first().time_created.date()
-    )
-    total_products = calculate_total_items(latest_run_products)
-    total_sold = calculate_total_sold(latest_run_products)
-    thirty_days_sold = calculate_sold_thirty_days(latest_run_products)
-    seven_days_sold = calculate_sold_seven_days(latest_run_products)
+    after = request.args.get("after")
+    products_page, stats = get_product_page("categories", filter, sort, page, after)
+    first_run_date = get_first_run_date(db)
     return render_template(
         "main.html",
         title="Dashboard",
@@ -257,10 +175,10 @@ def categories(filter, sort):
         sort=sort,
         products=products_page,
         first_run_date=first_run_date,
-        total_products=total_products,
-        total_sold=total_sold,
-        thirty_days_sold=thirty_days_sold,
-        seven_days_sold=seven_days_sold,
+        total_products=stats.total_products,
+        total_sold=stats.total_sold,
+        thirty_days_sold=stats.thirty_days_sold,
+        seven_days_sold=stats.seven_days_sold,
         form=SearchForm(),
     )
 
@@ -268,64 +186,10 @@ def categories(filter, sort):
 @app.route("/brands/<filter>/<sort>/", methods=["GET", "POST"])
 @login_required
 def brands(filter, sort):
-    latest_run_number = calculate_current_run_number(db) - 1
-    if sort == "total-lowest":
-        latest_run_products = (
-            Product.query.filter(Product.run_number == latest_run_number)
-            .filter(Product.brand == filter)
-            .order_by(Product.sold_all_time.asc())
-        )
-    elif sort == "seven-days-highest":
-        latest_run_products = (
-            Product.query.filter(Product.run_number == latest_run_number)
-            .filter(Product.brand == filter)
-            .order_by(Product.sold_seven_days.desc())
-        )
-    elif sort == "seven-days-lowest":
-        latest_run_products = (
-            Product.query.filter(Product.run_number == latest_run_number)
-            .filter(Product.brand == filter)
-            .order_by(Product.sold_seven_days.asc())
-        )
-    elif sort == "thirty-days-highest":
-        latest_run_products = (
-            Product.query.filter(Product.run_number == latest_run_number)
-            .filter(Product.brand == filter)
-            .order_by(Product.sold_thirty_days.desc())
-        )
-    elif sort == "thirty-days-lowest":
-        latest_run_products = (
-            Product.query.filter(Product.run_number == latest_run_number)
-            .filter(Product.brand == filter)
-            .order_by(Product.sold_thirty_days.asc())
-        )
-    elif sort == "price-highest":
-        latest_run_products = (
-            Product.query.filter(Product.run_number == latest_run_number)
-            .filter(Product.brand == filter)
-            .order_by(Product.price.desc())
-        )
-    elif sort == "price-lowest":
-        latest_run_products = (
-            Product.query.filter(Product.run_number == latest_run_number)
-            .filter(Product.brand == filter)
-            .order_by(Product.price.asc())
-        )
-    else:
-        latest_run_products = (
-            Product.query.filter(Product.run_number == latest_run_number)
-            .filter(Product.brand == filter)
-            .order_by(Product.sold_all_time.desc())
-        )
     page = request.args.get("page", 1, type=int)
-    products_page = latest_run_products.paginate(page=page, per_page=72)
-    first_run_date = (
-        Product.query.filter(Product.run_number == 1).first().time_created.date()
-    )
-    total_products = calculate_total_items(latest_run_products)
-    total_sold = calculate_total_sold(latest_run_products)
-    thirty_days_sold = calculate_sold_thirty_days(latest_run_products)
-    seven_days_sold = calculate_sold_seven_days(latest_run_products)
+    after = request.args.get("after")
+    products_page, stats = get_product_page("brands", filter, sort, page, after)
+    first_run_date = get_first_run_date(db)
     return render_template(
         "main.html",
         title="Dashboard",
@@ -336,10 +200,10 @@ def brands(filter, sort):
         sort=sort,
         products=products_page,
         first_run_date=first_run_date,
-        total_products=total_products,
-        total_sold=total_sold,
-        thirty_days_sold=thirty_days_sold,
-        seven_days_sold=seven_days_sold,
+        total_products=stats.total_products,
+        total_sold=stats.total_sold,
+        thirty_days_sold=stats.thirty_days_sold,
+        seven_days_sold=stats.seven_days_sold,
         form=SearchForm(),
     )
 
@@ -354,79 +218,13 @@ def brands(filter, sort):
 def search(sort, product_type):
     form = SearchForm()
     if form.validate_on_submit():
-        latest_run_number = calculate_current_run_number(db) - 1
-        latest_run_products = (
-            Product.query.filter(Product.run_number == latest_run_number)
-            .filter(Product.product_name.ilike(f"%{form.searched.data}%"))
-            .order_by(Product.sold_all_time.desc())
-        )
         product_type = form.searched.data
-    else:
-        if sort == "total-highest":
-            latest_run_number = calculate_current_run_number(db) - 1
-            latest_run_products = (
-                Product.query.filter(Product.run_number == latest_run_number)
-                .filter(Product.product_name.ilike(f"%{product_type}%"))
-                .order_by(Product.sold_all_time.desc())
-            )
-        elif sort == "total-lowest":
-            latest_run_number = calculate_current_run_number(db) - 1
-            latest_run_products = (
-                Product.query.filter(Product.run_number == latest_run_number)
-                .filter(Product.product_name.ilike(f"%{product_type}%"))
-                .order_by(Product.sold_all_time.asc())
-            )
-        elif sort == "seven-days-highest":
-            latest_run_number = calculate_current_run_number(db) - 1
-            latest_run_products = (
-                Product.query.filter(Product.run_number == latest_run_number)
-                .filter(Product.product_name.ilike(f"%{product_type}%"))
-                .order_by(Product.sold_seven_days.desc())
-            )
-        elif sort == "seven-days-lowest":
-            latest_run_number = calculate_current_run_number(db) - 1
-            latest_run_products = (
-                Product.query.filter(Product.run_number == latest_run_number)
-                .filter(Product.product_name.ilike(f"%{product_type}%"))
-                .order_by(Product.sold_seven_days.asc())
-            )
-        elif sort == "thirty-days-highest":
-            latest_run_number = calculate_current_run_number(db) - 1
-            latest_run_products = (
-                Product.query.filter(Product.run_number == latest_run_number)
-                .filter(Product.product_name.ilike(f"%{product_type}%"))
-                .order_by(Product.sold_thirty_days.desc())
-            )
-        elif sort == "thirty-days-lowest":
-            latest_run_number = calculate_current_run_number(db) - 1
-            latest_run_products = (
-                Product.query.filter(Product.run_number == latest_run_number)
-                .filter(Product.product_name.ilike(f"%{product_type}%"))
-                .order_by(Product.sold_thirty_days.asc())
-            )
-        elif sort == "price-highest":
-            latest_run_number = calculate_current_run_number(db) - 1
-            latest_run_products = (
-                Product.query.filter(Product.run_number == latest_run_number)
-                .filter(Product.product_name.ilike(f"%{product_type}%"))
-                .order_by(Product.price.desc())
-            )
-        elif sort == "price-lowest":
-            latest_run_number = calculate_current_run_number(db) - 1
-            latest_run_products = (
-                Product.query.filter(Product.run_number == latest_run_number)
-                .filter(Product.product_name.ilike(f"%{product_type}%"))
-                .order_by(Product.price.asc())
-            )
     page = request.args.get("page", 1, type=int)
-    products_page = latest_run_products.paginate(page=page, per_page=72)
-    first_run_date = (
-        Product.query.filter(Product.run_number == 1).first().time_created.date()
+    after = request.args.get("after")
+    products_page, stats = get_product_page(
+        "search", product_type or "", sort, page, after
     )
-    total_products = calculate_total_items(latest_run_products)
-    total_sold = calculate_total_sold(latest_run_products)
-    thirty_days_sold = calculate_sold_thirty_days(latest_run_products)
-    seven_days_sold = calculate_sold_seven_days(latest_run_products)
+    first_run_date = get_first_run_date(db)
     return render_template(
         "search.html",
         title="Dashboard",
@@ -436,9 +234,116 @@ def search(sort, product_type):
         sort=sort,
         products=products_page,
         first_run_date=first_run_date,
-        total_products=total_products,
-        total_sold=total_sold,
-        thirty_days_sold=thirty_days_sold,
-        seven_days_sold=seven_days_sold,
+        total_products=stats.total_products,
+        total_sold=stats.total_sold,
+        thirty_days_sold=stats.thirty_days_sold,
+        seven_days_sold=stats.seven_days_sold,
         form=SearchForm(),
     )
+
+
+@app.route("/search/autocomplete", methods=["GET"])
+@login_required
+def search_autocomplete():
+    term = request.args.get("term", "").strip()
+    if not term:
+        return jsonify([])
+    return jsonify(autocomplete_product_names(term))
+
+
+@app.route("/api/products", methods=["GET"])
+@login_required
+def faceted_products():
+    sort = request.args.get("sort", "total-highest")
+    page = request.args.get("page", 1, type=int)
+    per_page = request.args.get("per_page", 72, type=int)
+    try:
+        filters = parse_facet_filters(request.args)
+        sort_type = map_sort(sort)
+    except (KeyError, ValueError):
+        abort(400)
+    if page < 1 or not 1 <= per_page <= MAX_PER_PAGE:
+        abort(400)
+    result = query_faceted_products(db, filters, sort, page, per_page)
+    return jsonify({**result, "sort": sort, "sort_type": sort_type})
+
+
+@app.route("/api/products/<int:product_id>/history", methods=["GET"])
+@login_required
+def product_history(product_id):
+    histories = load_product_histories(db, [product_id])
+    if product_id not in histories:
+        abort(404)
+    return jsonify({"product_id": product_id, **histories[product_id]})
+
+
+@app.route("/api/products/history", methods=["GET"])
+@login_required
+def products_history():
+    try:
+        product_ids = [int(id) for id in request.args.get("ids", "").split(",") if id]
+    except ValueError:
+        abort(400)
+    if not product_ids or len(product_ids) > MAX_BATCH_PRODUCTS:
+        abort(400)
+    histories = load_product_histories(db, product_ids)
+    return jsonify(
+        {
+            "products": [
+                {"product_id": product_id, **histories[product_id]}
+                for product_id in product_ids
+                if product_id in histories
+            ]
+        }
+    )
+
+
+@app.route("/api/analytics/movers", methods=["GET"])
+@login_required
+def analytics_movers():
+    limit = min(request.args.get("limit", 20, type=int), MAX_MOVERS)
+    movers = load_top_movers(db, request.args.get("category"), max(limit, 1))
+    return jsonify({"movers": movers})
+
+
+@app.route("/api/products/<int:product_id>/analytics", methods=["GET"])
+@login_required
+def product_analytics(product_id):
+    analytics, events = load_product_analytics(db, product_id)
+    if analytics is None:
+        abort(404)
+    return jsonify({**analytics_to_dict(analytics), "events": events})
+
+
+@app.route("/export/products.<format>", methods=["GET"])
+@login_required
+def export_products(format):
+    if format not in EXPORT_FORMATS:
+        abort(404)
+    if format == "parquet" and not parquet_available():
+        abort(501)  # Checked before the streamed response starts
+    batches = iter_export_batches(
+        run_number=request.args.get("run", type=int),
+        start_date=request.args.get("start", type=date.fromisoformat),
+        end_date=request.args.get("end", type=date.fromisoformat),
+        category=request.args.get("category"),
+        brand=request.args.get("brand"),
+        term=request.args.get("search"),
+        sort=request.args.get("sort"),
+    )
+    if format == "parquet":
+        chunks = iter_parquet_chunks(batches)
+    else:
+        chunks = iter_csv_chunks(batches)
+    return Response(
+        stream_with_context(chunks),
+        mimetype=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename=products.{format}"},
+    )
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    if not app.config["METRICS_ENABLED"]:
+        abort(404)
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
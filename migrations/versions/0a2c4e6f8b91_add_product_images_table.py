@@ -0,0 +1,38 @@
+"""add product images table
+
+Revision ID: 0a2c4e6f8b91
+Revises: f7b9d1e3a480
+Create Date: 2026-10-18 10:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0a2c4e6f8b91"
+down_revision = "f7b9d1e3a480"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "product_images",
+        sa.Column("product_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("url", sa.String(length=400), nullable=False),
+        sa.Column("etag", sa.String(length=200), nullable=True),
+        sa.Column("last_modified", sa.String(length=100), nullable=True),
+        sa.Column("content_hash", sa.String(length=64), nullable=False),
+        sa.Column(
+            "time_synced",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("product_id"),
+    )
+
+
+def downgrade():
+    op.drop_table("product_images")
@@ -0,0 +1,54 @@
+"""add product histories table
+
+Revision ID: 1b3d5f7a9c02
+Revises: 0a2c4e6f8b91
+Create Date: 2026-10-18 10:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "1b3d5f7a9c02"
+down_revision = "0a2c4e6f8b91"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "product_histories",
+        sa.Column("product_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("run_numbers", postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.Column("prices", postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.Column("stocks", postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.Column("sold_all_time", postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.Column(
+            "time_updated",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("product_id"),
+    )
+    # Backfilled from the full history, the table is kept up to date by ingestion
+    op.execute(
+        """
+        INSERT INTO product_histories (
+            product_id, run_numbers, prices, stocks, sold_all_time
+        )
+        SELECT product_id,
+               array_agg(run_number ORDER BY run_number),
+               array_agg(round(price * 100)::integer ORDER BY run_number),
+               array_agg(stock ORDER BY run_number),
+               array_agg(sold_all_time ORDER BY run_number)
+        FROM products
+        GROUP BY product_id
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("product_histories")
@@ -0,0 +1,74 @@
+"""add product analytics tables
+
+Revision ID: 2c4e6a8b0d13
+Revises: 1b3d5f7a9c02
+Create Date: 2026-10-18 10:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "2c4e6a8b0d13"
+down_revision = "1b3d5f7a9c02"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "product_analytics",
+        sa.Column("product_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("run_number", sa.Integer(), nullable=False),
+        sa.Column("category", sa.String(length=200), nullable=False),
+        sa.Column("stock", sa.Integer(), nullable=True),
+        sa.Column("sold_seven_days", sa.Integer(), nullable=False),
+        sa.Column("sold_previous_seven_days", sa.Integer(), nullable=False),
+        sa.Column("sold_thirty_days", sa.Integer(), nullable=False),
+        sa.Column("velocity_seven_days", sa.Float(), nullable=True),
+        sa.Column("velocity_twenty_eight_days", sa.Float(), nullable=True),
+        sa.Column("week_over_week", sa.Float(), nullable=True),
+        sa.Column("sold_change", sa.Integer(), nullable=False),
+        sa.Column("mover_rank", sa.Integer(), nullable=False),
+        sa.Column("sell_through", sa.Float(), nullable=True),
+        sa.Column("days_of_stock", sa.Float(), nullable=True),
+        sa.Column("restock_count", sa.Integer(), nullable=False),
+        sa.Column("last_restock_run", sa.Integer(), nullable=True),
+        sa.Column("restock_interval", sa.Float(), nullable=True),
+        sa.Column("price_change_count", sa.Integer(), nullable=False),
+        sa.Column("last_price_change_run", sa.Integer(), nullable=True),
+        sa.Column("last_price_change", sa.Float(), nullable=True),
+        sa.Column(
+            "time_computed",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("product_id"),
+    )
+    op.create_index(
+        "ix_product_analytics_category_mover_rank",
+        "product_analytics",
+        ["category", "mover_rank"],
+    )
+    op.create_index(
+        "ix_product_analytics_sold_change", "product_analytics", ["sold_change"]
+    )
+    op.create_table(
+        "product_events",
+        sa.Column("product_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("run_number", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("kind", sa.String(length=20), nullable=False),
+        sa.Column("value", sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint("product_id", "run_number", "kind"),
+    )
+
+
+def downgrade():
+    op.drop_table("product_events")
+    op.drop_index("ix_product_analytics_sold_change", table_name="product_analytics")
+    op.drop_index(
+        "ix_product_analytics_category_mover_rank", table_name="product_analytics"
+    )
+    op.drop_table("product_analytics")
@@ -0,0 +1,78 @@
+"""add product daily sales table
+
+Revision ID: 3d5f7b9c1e24
+Revises: 2c4e6a8b0d13
+Create Date: 2026-10-18 10:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3d5f7b9c1e24"
+down_revision = "2c4e6a8b0d13"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "product_daily_sales",
+        sa.Column("product_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("sold", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("product_id", "day"),
+    )
+    op.create_index(
+        "ix_product_daily_sales_day", "product_daily_sales", ["day", "product_id"]
+    )
+    # Backfilled from the stored history (as rebuild_daily_sales does), the table
+    # is kept up to date by ingestion, which reads its sales windows from it
+    op.execute(
+        """
+        INSERT INTO product_daily_sales (product_id, day, sold)
+        SELECT product_id, day, sold
+        FROM (
+            SELECT product_id,
+                   day,
+                   last_sold_all_time - coalesce(
+                       lag(last_sold_all_time) OVER (
+                           PARTITION BY product_id ORDER BY day
+                       ),
+                       first_sold_all_time
+                   ) AS sold
+            FROM (
+                SELECT product_id,
+                       day,
+                       min(sold_all_time) AS first_sold_all_time,
+                       max(sold_all_time) AS last_sold_all_time
+                FROM (
+                    SELECT products.product_id,
+                           CAST(
+                               timezone(
+                                   'UTC',
+                                   coalesce(runs.time_started, products.time_created)
+                               ) AS date
+                           ) AS day,
+                           products.sold_all_time
+                    FROM products
+                    LEFT OUTER JOIN runs ON runs.run_number = products.run_number
+                    UNION ALL
+                    SELECT product_snapshots.product_id,
+                           CAST(timezone('UTC', runs.time_started) AS date),
+                           product_snapshots.sold_all_time
+                    FROM product_snapshots
+                    JOIN runs ON runs.run_number = product_snapshots.run_number
+                ) AS history
+                GROUP BY product_id, day
+            ) AS days
+        ) AS ledger
+        WHERE sold > 0
+        """
+    )
+
+
+def downgrade():
+    op.drop_index("ix_product_daily_sales_day", table_name="product_daily_sales")
+    op.drop_table("product_daily_sales")
@@ -0,0 +1,47 @@
+"""add runs table
+
+Revision ID: 4d2b8e6f0a13
+Revises: a1c3e5f7b901
+Create Date: 2026-10-18 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "4d2b8e6f0a13"
+down_revision = "a1c3e5f7b901"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "runs",
+        sa.Column("run_number", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column(
+            "time_started",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.Column("time_finished", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("product_count", sa.Integer(), nullable=True),
+        sa.Column("duration", sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint("run_number"),
+    )
+    # Record runs written before the table existed as completed
+    op.execute(
+        """
+        INSERT INTO runs (run_number, time_started, time_finished, status, product_count)
+        SELECT run_number, min(time_created), max(time_created), 'completed', count(*)
+        FROM products
+        GROUP BY run_number
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("runs")
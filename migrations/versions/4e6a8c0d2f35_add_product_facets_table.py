@@ -0,0 +1,84 @@
+"""add product facets table
+
+Revision ID: 4e6a8c0d2f35
+Revises: 3d5f7b9c1e24
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "4e6a8c0d2f35"
+down_revision = "3d5f7b9c1e24"
+branch_labels = None
+depends_on = None
+
+# Category labels as of this revision, the facet label of each category slug
+CATEGORY_LABELS = {
+    "outdoor-wireless": "Outdoor Wireless",
+    "home-office-networks": "Home and Office Networks",
+    "lte-products": "LTE Products",
+    "fiber-networks": "Fiber Networks",
+    "security-systems": "Security Systems",
+    "iot-products": "IoT Solutions",
+    "fleet-management": "Fleet Management",
+    "cables-and-cabinets": "Cables and Cabinets",
+    "electrical-equipment": "Electrical Equipment",
+    "mounts-and-brackets": "Mounts and Brackets",
+    "gadgets": "Gadgets",
+}
+
+
+def upgrade():
+    op.create_table(
+        "product_facets",
+        sa.Column("dimension", sa.String(length=20), nullable=False),
+        sa.Column("value", sa.String(length=200), nullable=False),
+        sa.Column("label", sa.String(length=200), nullable=False),
+        sa.Column("product_count", sa.Integer(), nullable=False),
+        sa.Column("in_stock_count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("dimension", "value"),
+    )
+    op.create_index(
+        "ix_current_products_subcategory_id", "current_products", ["subcategory_id"]
+    )
+    # Counts the current products, until the next ingestion refreshes them
+    labels = ", ".join(
+        f"('{slug}', '{label}')" for slug, label in CATEGORY_LABELS.items()
+    )
+    op.execute(
+        f"""
+        INSERT INTO product_facets
+            (dimension, value, label, product_count, in_stock_count)
+        SELECT
+            CASE
+                WHEN GROUPING(category) = 0 THEN 'category'
+                WHEN GROUPING(subcategory_id) = 0 THEN 'subcategory'
+                ELSE 'brand'
+            END,
+            CASE
+                WHEN GROUPING(category) = 0 THEN category
+                WHEN GROUPING(subcategory_id) = 0 THEN subcategory_id::text
+                ELSE brand
+            END,
+            CASE
+                WHEN GROUPING(category) = 0
+                    THEN coalesce(min(labels.label), category)
+                WHEN GROUPING(subcategory_id) = 0 THEN min(subcategory)
+                ELSE brand
+            END,
+            count(*),
+            count(*) FILTER (WHERE stock > 0)
+        FROM current_products
+        LEFT JOIN (VALUES {labels}) AS labels (slug, label)
+            ON labels.slug = current_products.category
+        GROUP BY GROUPING SETS ((category), (subcategory_id), (brand))
+        """
+    )
+
+
+def downgrade():
+    op.drop_index("ix_current_products_subcategory_id", table_name="current_products")
+    op.drop_table("product_facets")
@@ -0,0 +1,59 @@
+"""add products indexes
+
+Revision ID: 7e9f1a3b5c24
+Revises: 4d2b8e6f0a13
+Create Date: 2026-10-18 09:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7e9f1a3b5c24"
+down_revision = "4d2b8e6f0a13"
+branch_labels = None
+depends_on = None
+
+PRODUCTS_INDEXES = {
+    "ix_products_run_number_sold_all_time": ["run_number", "sold_all_time"],
+    "ix_products_run_number_sold_thirty_days": ["run_number", "sold_thirty_days"],
+    "ix_products_run_number_sold_seven_days": ["run_number", "sold_seven_days"],
+    "ix_products_run_number_price": ["run_number", "price"],
+    "ix_products_run_number_category_sold_all_time": [
+        "run_number",
+        "category",
+        "sold_all_time",
+    ],
+    "ix_products_run_number_brand_sold_all_time": [
+        "run_number",
+        "brand",
+        "sold_all_time",
+    ],
+    "ix_products_product_id_run_number": ["product_id", "run_number"],
+    "ix_products_time_created": ["time_created"],
+}
+
+
+def upgrade():
+    # Built concurrently so ingestion and the dashboard keep working on large tables
+    with op.get_context().autocommit_block():
+        for name, columns in PRODUCTS_INDEXES.items():
+            op.create_index(
+                name,
+                "products",
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in PRODUCTS_INDEXES:
+            op.drop_index(
+                name,
+                table_name="products",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
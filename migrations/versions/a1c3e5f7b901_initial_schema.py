@@ -0,0 +1,56 @@
+"""initial schema
+
+Revision ID: a1c3e5f7b901
+Revises: 
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a1c3e5f7b901"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "user",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("email", sa.String(length=120), nullable=False),
+        sa.Column("password", sa.String(length=60), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("email"),
+    )
+    op.create_table(
+        "products",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("product_id", sa.Integer(), nullable=False),
+        sa.Column("product_name", sa.String(length=200), nullable=False),
+        sa.Column("brand", sa.String(length=200), nullable=False),
+        sa.Column("category", sa.String(length=200), nullable=False),
+        sa.Column("subcategory", sa.String(length=200), nullable=False),
+        sa.Column("subcategory_id", sa.Integer(), nullable=False),
+        sa.Column("price", sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.Column("stock", sa.Integer(), nullable=False),
+        sa.Column("sold_all_time", sa.Integer(), nullable=False),
+        sa.Column("sold_thirty_days", sa.Integer(), nullable=False),
+        sa.Column("sold_seven_days", sa.Integer(), nullable=False),
+        sa.Column("image", sa.String(length=400), nullable=False),
+        sa.Column("run_number", sa.Integer(), nullable=False),
+        sa.Column(
+            "time_created",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade():
+    op.drop_table("products")
+    op.drop_table("user")
@@ -0,0 +1,59 @@
+"""add current products table
+
+Revision ID: b5d7f9a1c346
+Revises: 7e9f1a3b5c24
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b5d7f9a1c346"
+down_revision = "7e9f1a3b5c24"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "current_products",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("product_id", sa.Integer(), nullable=False),
+        sa.Column("product_name", sa.String(length=200), nullable=False),
+        sa.Column("brand", sa.String(length=200), nullable=False),
+        sa.Column("category", sa.String(length=200), nullable=False),
+        sa.Column("subcategory", sa.String(length=200), nullable=False),
+        sa.Column("subcategory_id", sa.Integer(), nullable=False),
+        sa.Column("price", sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.Column("stock", sa.Integer(), nullable=False),
+        sa.Column("sold_all_time", sa.Integer(), nullable=False),
+        sa.Column("sold_thirty_days", sa.Integer(), nullable=False),
+        sa.Column("sold_seven_days", sa.Integer(), nullable=False),
+        sa.Column("image", sa.String(length=400), nullable=False),
+        sa.Column("run_number", sa.Integer(), nullable=False),
+        sa.Column(
+            "time_created",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_current_products_category", "current_products", ["category"])
+    op.create_index("ix_current_products_brand", "current_products", ["brand"])
+    # Fill the snapshot with the latest completed run
+    op.execute(
+        """
+        INSERT INTO current_products
+        SELECT * FROM products
+        WHERE run_number = (SELECT max(run_number) FROM runs WHERE status = 'completed')
+        """
+    )
+
+
+def downgrade():
+    op.drop_index("ix_current_products_brand", table_name="current_products")
+    op.drop_index("ix_current_products_category", table_name="current_products")
+    op.drop_table("current_products")
@@ -0,0 +1,37 @@
+"""add product name trigram index
+
+Revision ID: c8e0a2b4d657
+Revises: b5d7f9a1c346
+Create Date: 2026-10-18 09:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c8e0a2b4d657"
+down_revision = "b5d7f9a1c346"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return  # Other databases search with a plain LIKE
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        "ix_current_products_product_name_trgm",
+        "current_products",
+        ["product_name"],
+        postgresql_using="gin",
+        postgresql_ops={"product_name": "gin_trgm_ops"},
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.drop_index(
+        "ix_current_products_product_name_trgm", table_name="current_products"
+    )
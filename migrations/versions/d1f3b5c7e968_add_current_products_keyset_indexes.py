@@ -0,0 +1,39 @@
+"""add current products keyset indexes
+
+Revision ID: d1f3b5c7e968
+Revises: c8e0a2b4d657
+Create Date: 2026-10-18 09:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d1f3b5c7e968"
+down_revision = "c8e0a2b4d657"
+branch_labels = None
+depends_on = None
+
+KEYSET_INDEXES = {
+    "ix_current_products_sold_all_time_product_id": ["sold_all_time", "product_id"],
+    "ix_current_products_sold_thirty_days_product_id": [
+        "sold_thirty_days",
+        "product_id",
+    ],
+    "ix_current_products_sold_seven_days_product_id": [
+        "sold_seven_days",
+        "product_id",
+    ],
+    "ix_current_products_price_product_id": ["price", "product_id"],
+}
+
+
+def upgrade():
+    for name, columns in KEYSET_INDEXES.items():
+        op.create_index(name, "current_products", columns)
+
+
+def downgrade():
+    for name in KEYSET_INDEXES:
+        op.drop_index(name, table_name="current_products")
@@ -0,0 +1,51 @@
+"""add delta storage tables
+
+Revision ID: e4a6c8f0b279
+Revises: d1f3b5c7e968
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e4a6c8f0b279"
+down_revision = "d1f3b5c7e968"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "product_details",
+        sa.Column("product_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("product_name", sa.String(length=200), nullable=False),
+        sa.Column("brand", sa.String(length=200), nullable=False),
+        sa.Column("category", sa.String(length=200), nullable=False),
+        sa.Column("subcategory", sa.String(length=200), nullable=False),
+        sa.Column("subcategory_id", sa.Integer(), nullable=False),
+        sa.Column("image", sa.String(length=400), nullable=False),
+        sa.Column(
+            "time_updated",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("product_id"),
+    )
+    op.create_table(
+        "product_snapshots",
+        sa.Column("product_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("run_number", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("price", sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.Column("stock", sa.Integer(), nullable=False),
+        sa.Column("sold_all_time", sa.Integer(), nullable=False),
+        sa.Column("removed", sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint("product_id", "run_number"),
+    )
+
+
+def downgrade():
+    op.drop_table("product_snapshots")
+    op.drop_table("product_details")
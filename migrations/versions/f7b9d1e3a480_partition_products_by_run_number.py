@@ -0,0 +1,109 @@
+"""partition products by run number
+
+Revision ID: f7b9d1e3a480
+Revises: e4a6c8f0b279
+Create Date: 2026-10-18 10:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "f7b9d1e3a480"
+down_revision = "e4a6c8f0b279"
+branch_labels = None
+depends_on = None
+
+RUNS_PER_PARTITION = 30  # Keep in sync with main.history
+
+PRODUCTS_INDEXES = {
+    "ix_products_run_number_sold_all_time": "run_number, sold_all_time",
+    "ix_products_run_number_sold_thirty_days": "run_number, sold_thirty_days",
+    "ix_products_run_number_sold_seven_days": "run_number, sold_seven_days",
+    "ix_products_run_number_price": "run_number, price",
+    "ix_products_run_number_category_sold_all_time": "run_number, category, sold_all_time",
+    "ix_products_run_number_brand_sold_all_time": "run_number, brand, sold_all_time",
+    "ix_products_product_id_run_number": "product_id, run_number",
+    "ix_products_time_created": "time_created",
+}
+
+
+def upgrade():
+    op.create_table(
+        "product_summaries",
+        sa.Column("product_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("period", sa.String(length=10), nullable=False),
+        sa.Column("period_start", sa.Date(), nullable=False),
+        sa.Column("product_name", sa.String(length=200), nullable=False),
+        sa.Column("brand", sa.String(length=200), nullable=False),
+        sa.Column("category", sa.String(length=200), nullable=False),
+        sa.Column("run_count", sa.Integer(), nullable=False),
+        sa.Column("first_run_number", sa.Integer(), nullable=False),
+        sa.Column("last_run_number", sa.Integer(), nullable=False),
+        sa.Column("min_price", sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.Column("max_price", sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.Column("total_price", sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column("min_stock", sa.Integer(), nullable=False),
+        sa.Column("max_stock", sa.Integer(), nullable=False),
+        sa.Column("last_stock", sa.Integer(), nullable=False),
+        sa.Column("first_sold_all_time", sa.Integer(), nullable=False),
+        sa.Column("last_sold_all_time", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("product_id", "period", "period_start"),
+    )
+
+    if op.get_bind().dialect.name != "postgresql":
+        return  # Partitioning is PostgreSQL only, compaction deletes rows elsewhere
+
+    # Rebuilds products as a table range partitioned by run number. The primary
+    # key of a partitioned table has to include the partition key.
+    op.execute("ALTER TABLE products RENAME TO products_unpartitioned")
+    op.execute(
+        "ALTER TABLE products_unpartitioned "
+        "RENAME CONSTRAINT products_pkey TO products_unpartitioned_pkey"
+    )
+    op.execute(
+        """
+        CREATE TABLE products (
+            LIKE products_unpartitioned INCLUDING DEFAULTS,
+            PRIMARY KEY (id, run_number)
+        ) PARTITION BY RANGE (run_number)
+        """
+    )
+    op.execute("ALTER SEQUENCE products_id_seq OWNED BY products.id")
+    last_run = op.get_bind().execute(
+        sa.text("SELECT coalesce(max(run_number), 0) FROM products_unpartitioned")
+    ).scalar()
+    for start in range(1, last_run + RUNS_PER_PARTITION + 1, RUNS_PER_PARTITION):
+        op.execute(
+            f"CREATE TABLE products_runs_{start:06d} PARTITION OF products "
+            f"FOR VALUES FROM ({start}) TO ({start + RUNS_PER_PARTITION})"
+        )
+    op.execute("CREATE TABLE products_default PARTITION OF products DEFAULT")
+    op.execute("INSERT INTO products SELECT * FROM products_unpartitioned")
+    op.execute("DROP TABLE products_unpartitioned")
+    for name, columns in PRODUCTS_INDEXES.items():
+        op.execute(f"CREATE INDEX {name} ON products ({columns})")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("ALTER TABLE products RENAME TO products_partitioned")
+        op.execute(
+            "ALTER TABLE products_partitioned "
+            "RENAME CONSTRAINT products_pkey TO products_partitioned_pkey"
+        )
+        op.execute(
+            """
+            CREATE TABLE products (
+                LIKE products_partitioned INCLUDING DEFAULTS,
+                PRIMARY KEY (id)
+            )
+            """
+        )
+        op.execute("ALTER SEQUENCE products_id_seq OWNED BY products.id")
+        op.execute("INSERT INTO products SELECT * FROM products_partitioned")
+        op.execute("DROP TABLE products_partitioned")
+        for name, columns in PRODUCTS_INDEXES.items():
+            op.execute(f"CREATE INDEX {name} ON products ({columns})")
+    op.drop_table("product_summaries")
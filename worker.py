@@ -0,0 +1,33 @@
+from main.ingestion import run_ingestion
+from apscheduler.schedulers.blocking import BlockingScheduler
+from datetime import datetime, timedelta, timezone
+
+RESUME_ATTEMPTS = 3  # Failed updates resumed from their checkpoints the same day
+RESUME_DELAY_MINUTES = 15
+
+scheduler = BlockingScheduler(timezone="utc")
+
+
+def update_products(attempt=1):
+    """
+    Runs an ingestion, resuming it later from the categories already fetched if it fails.
+    """
+    try:
+        run_ingestion()
+    except Exception as error:
+        print(f"Error, unable to update products: {error}")
+        if attempt < RESUME_ATTEMPTS:
+            scheduler.add_job(
+                update_products,
+                "date",
+                run_date=datetime.now(timezone.utc)
+                + timedelta(minutes=RESUME_DELAY_MINUTES),
+                args=[attempt + 1],
+            )
+
+
+# Schedules product data to be updated each day at the specified time
+scheduler.add_job(update_products, "cron", hour="21", minute="35")
+
+if __name__ == "__main__":
+    scheduler.start()